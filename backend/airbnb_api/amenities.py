@@ -0,0 +1,62 @@
+from django.db.models import F
+from .models import Amenity, ListingAmenity
+
+# Listing.amenity_bits is a signed 64-bit column; the sign bit is left alone
+MAX_AMENITY_BITS = 63
+
+
+def assign_bits(amenities):
+    # Give amenities without a bit the lowest free ones, while any are left.
+    # Only valid for amenities no listing has yet. The objects may be stale:
+    # an ignore_conflicts insert returns no bit for a row a concurrent ingest
+    # already numbered and gave listings, so the stored bits are read back
+    # under a row lock and only rows still without one are numbered (call
+    # inside a transaction). Amenity.bit is unique, so two ingests racing
+    # for the same free bit fail rather than share it.
+    missing = [amenity for amenity in amenities if amenity.bit is None]
+    if not missing:
+        return
+    stored = dict(Amenity.objects.select_for_update().filter(
+        pk__in=[amenity.pk for amenity in missing]
+    ).order_by('pk').values_list('id', 'bit'))
+    for amenity in missing:
+        amenity.bit = stored[amenity.pk]
+    missing = [amenity for amenity in missing if amenity.bit is None]
+    if not missing:
+        return
+    used = set(Amenity.objects.filter(bit__isnull=False).values_list('bit', flat=True))
+    free = [bit for bit in range(MAX_AMENITY_BITS) if bit not in used]
+    assigned = []
+    for amenity, bit in zip(missing, free):
+        amenity.bit = bit
+        assigned.append(amenity)
+    if assigned:
+        Amenity.objects.bulk_update(assigned, ['bit'])
+
+
+def amenity_mask(amenities):
+    mask = 0
+    for amenity in amenities:
+        if amenity.bit is not None:
+            mask |= 1 << amenity.bit
+    return mask
+
+
+def filter_amenities(queryset, names):
+    # Listings (or search docs) that have every named amenity. Amenities
+    # with a bit are matched with a single bitwise test on amenity_bits;
+    # only amenities beyond the first 63 need a subquery each.
+    names = set(names)
+    amenities = list(Amenity.objects.filter(name__in=names).only('id', 'name', 'bit'))
+    if len(amenities) < len(names):
+        return queryset.none()
+
+    mask = amenity_mask(amenities)
+    if mask:
+        queryset = queryset.alias(matched_amenities=F('amenity_bits').bitand(mask)).filter(
+            matched_amenities=mask
+        )
+    for amenity in amenities:
+        if amenity.bit is None:
+            queryset = queryset.filter(id__in=ListingAmenity.objects.filter(amenity=amenity).values('listing_id'))
+    return queryset
@@ -0,0 +1,114 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .cache import acached_entry
+from .fastpath import FastListingSerializer
+from .filters import filter_listings
+from .models import Listing
+from .pagination import KEYSET_ORDERING, ListingPagination, decode_cursor, encode_cursor, keyset_filter
+from .renderers import FastJSONRenderer
+from .serializers import ListingSerializer, ListingCardSerializer, listing_queryset, selected_fields
+
+# Async equivalents of ListingViewSet.list and .retrieve for ASGI servers
+# (django_backend/asgi.py). While a query runs the event loop serves other
+# requests, so one process handles many concurrent searches. They answer
+# like the fast path: same fields, filters, pagination and response cache.
+# Django 4.2's async ORM cannot prefetch, which the fast path never needs.
+
+renderer = FastJSONRenderer()
+
+
+async def listing_list(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    fields = selected_fields(ListingCardSerializer, request.GET)
+    fast_serializer = FastListingSerializer(ListingCardSerializer(context={'fields': fields}))
+
+    async def build():
+        # Filters may look up amenities, which is a synchronous query
+        queryset = await sync_to_async(filter_listings)(listing_queryset(fields), request.GET)
+        return await paginate(request, fast_serializer, queryset)
+
+    try:
+        return respond(request, await acached_entry(request, build))
+    except NotFound as exc:
+        return respond(request, None, exc.detail)
+
+
+async def listing_detail(request, pk):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    fields = selected_fields(ListingSerializer, request.GET)
+    fast_serializer = FastListingSerializer(ListingSerializer(context={'fields': fields}))
+
+    async def build():
+        try:
+            row = await fast_serializer.values(listing_queryset(fields)).aget(pk=pk)
+        except Listing.DoesNotExist:
+            return None
+        return (await fast_serializer.aserialize([row]))[0]
+
+    return respond(request, await acached_entry(request, build))
+
+
+async def paginate(request, fast_serializer, queryset):
+    # Same responses as ListingPagination: keyset pages on (rating, id),
+    # page numbers with ?page= or when a search reorders the results
+    pagination = ListingPagination()
+    page_size = pagination.get_page_size(request)
+    url = request.build_absolute_uri()
+    rows = fast_serializer.values(queryset)
+
+    if 'page' not in request.GET and tuple(queryset.query.order_by) == KEYSET_ORDERING:
+        cursor = request.GET.get(pagination.cursor_query_param)
+        if cursor:
+            rows = keyset_filter(rows, *decode_cursor(cursor))
+        page = [row async for row in rows[:page_size + 1]]
+        next_link = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_link = replace_query_param(url, pagination.cursor_query_param,
+                                            encode_cursor(page[-1]['rating'], page[-1]['id']))
+        return {
+            'next': next_link,
+            'first': remove_query_param(url, pagination.cursor_query_param),
+            'results': await fast_serializer.aserialize(page),
+        }
+
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        raise NotFound('Invalid page.')
+    count = await queryset.acount()
+    offset = (number - 1) * page_size
+    if number < 1 or (number > 1 and offset >= count):
+        raise NotFound('Invalid page.')
+    page = [row async for row in rows[offset:offset + page_size]]
+
+    previous_link = None
+    if number == 2:
+        previous_link = remove_query_param(url, 'page')
+    elif number > 2:
+        previous_link = replace_query_param(url, 'page', number - 1)
+    return {
+        'count': count,
+        'next': replace_query_param(url, 'page', number + 1) if offset + page_size < count else None,
+        'previous': previous_link,
+        'results': await fast_serializer.aserialize(page),
+    }
+
+
+def respond(request, entry, detail='Not found.'):
+    if entry is None:
+        return HttpResponse(renderer.render({'detail': str(detail)}), status=404,
+                            content_type='application/json')
+    etag, data = entry
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    return HttpResponse(renderer.render(data), content_type='application/json', headers={'ETag': etag})
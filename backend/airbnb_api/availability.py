@@ -0,0 +1,85 @@
+import datetime
+from decimal import Decimal
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Value
+from .models import AvailabilityWindow
+
+EPOCH = datetime.date(1970, 1, 1)
+MAX_STAY_NIGHTS = 365
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+CENT = Decimal('0.01')
+
+
+def day_number(date):
+    return (date - EPOCH).days
+
+
+def build_windows(listing, windows, today=None):
+    # AvailabilityWindow rows for a listing from (start, end, nightly_price)
+    # date ranges: past nights dropped, overlaps clipped, adjacent windows
+    # with the same price merged, and each run of free nights annotated
+    # with its end and the running price total
+    today = day_number(today or datetime.date.today())
+    ranges = []
+    for window in sorted(windows, key=lambda window: window['start']):
+        start = max(day_number(window['start']), today)
+        end = day_number(window['end'])
+        price = window.get('nightly_price')
+        price = Decimal(str(listing.price_per_night if price is None else price)).quantize(CENT)
+        if ranges and start < ranges[-1][1]:
+            start = ranges[-1][1]
+        if start >= end:
+            continue
+        if ranges and start == ranges[-1][1] and price == ranges[-1][2]:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end, price])
+
+    rows = []
+    run = []
+    for start, end, price in ranges:
+        if run and start != run[-1].end_day:
+            _close_run(run)
+            run = []
+        price_before = run[-1].price_before + (run[-1].end_day - run[-1].start_day) * run[-1].nightly_price if run else 0
+        row = AvailabilityWindow(listing=listing, start_day=start, end_day=end, run_end_day=end,
+                                 nightly_price=price, price_before=price_before)
+        run.append(row)
+        rows.append(row)
+    if run:
+        _close_run(run)
+    return rows
+
+
+def _close_run(run):
+    for row in run:
+        row.run_end_day = run[-1].end_day
+
+
+def _cumulative_price(day):
+    # Price of the run's nights before `day`, from the window containing it
+    return ExpressionWrapper(
+        F('price_before') + (Value(day) - F('start_day')) * F('nightly_price'), output_field=MONEY
+    )
+
+
+def filter_available(queryset, check_in, check_out):
+    # Listings free for every night of [check_in, check_out), annotated with
+    # the stay's total price. A stay is free when the window containing its
+    # first night belongs to a run lasting until check_out, so both the
+    # filter (a range scan of availability_range_idx over windows starting
+    # by check_in; past nights are never stored) and the total (one lookup
+    # per end of the stay) cost the same whatever the stay length.
+    # Works on any queryset whose pk is the listing id.
+    first, last = day_number(check_in), day_number(check_out)
+    if not 0 < last - first <= MAX_STAY_NIGHTS:
+        return queryset.none()
+
+    starts = AvailabilityWindow.objects.filter(start_day__lte=first, end_day__gt=first, run_end_day__gte=last)
+    start_window = starts.filter(listing=OuterRef('pk'))
+    end_window = AvailabilityWindow.objects.filter(listing=OuterRef('pk'), start_day__lt=last, end_day__gte=last)
+    return queryset.filter(id__in=starts.values('listing_id')).annotate(stay_total=ExpressionWrapper(
+        Subquery(end_window.annotate(total=_cumulative_price(last)).values('total')[:1])
+        - Subquery(start_window.annotate(total=_cumulative_price(first)).values('total')[:1]),
+        output_field=MONEY
+    ))
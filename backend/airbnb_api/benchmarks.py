@@ -0,0 +1,505 @@
+import datetime
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import Length
+from django.http import QueryDict
+from rest_framework.renderers import JSONRenderer
+from .filters import filter_listings
+from .geo import encode_geohash
+from .models import (normalize_location, Host, Listing, Image, ListingImage, Amenity, ListingAmenity, ListingSearchDoc,
+                     AvailabilityWindow)
+from .search_docs import load_cards, refresh_search_docs
+from .amenities import amenity_mask, assign_bits
+from .availability import build_windows
+from .images import THUMBNAIL_IDS, decode_ids
+from .pagination import keyset_filter
+from .ingest import ingest_listings
+from .serializers import ListingSerializer, ListingCardSerializer, listing_queryset, selected_fields
+from .fastpath import FastListingSerializer
+from .renderers import FastJSONRenderer
+
+# (city, latitude, longitude) used to spread synthetic listings around
+CITIES = [
+    ('New York', 40.7128, -74.0060),
+    ('Los Angeles', 34.0522, -118.2437),
+    ('Miami Beach', 25.7907, -80.1300),
+    ('Austin', 30.2672, -97.7431),
+    ('Asheville', 35.5951, -82.5515),
+    ('Lahaina', 20.8783, -156.6825),
+    ('London', 51.5074, -0.1278),
+    ('Paris', 48.8566, 2.3522),
+    ('Barcelona', 41.3874, 2.1686),
+    ('Tokyo', 35.6762, 139.6503),
+    ('Sydney', -33.8688, 151.2093),
+    ('Cape Town', -33.9249, 18.4241),
+]
+
+PROPERTY_TYPES = ['Entire home', 'Apartment', 'Cabin', 'Loft', 'Bungalow', 'Townhouse', 'Private room']
+
+AMENITIES = ['Wifi', 'Kitchen', 'Air conditioning', 'Heating', 'Pool', 'Free parking', 'Washer',
+             'Dryer', 'TV', 'Gym', 'Fireplace', 'BBQ grill', 'Beach access', 'Garden', 'Hot tub']
+
+DESCRIPTION_WORDS = ['bright', 'quiet', 'spacious', 'cozy', 'modern', 'historic', 'apartment',
+                     'house', 'view', 'garden', 'beach', 'downtown', 'walk', 'restaurants',
+                     'shops', 'subway', 'family', 'friends', 'kitchen', 'balcony', 'terrace']
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+@contextmanager
+def scratch_data():
+    # Everything written inside is rolled back when the benchmark finishes
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def synthetic_listing(rng, host, idx):
+    city, latitude, longitude = rng.choice(CITIES)
+    latitude += rng.uniform(-0.3, 0.3)
+    longitude += rng.uniform(-0.3, 0.3)
+    return Listing(
+        title=f'{rng.choice(PROPERTY_TYPES)} in {city} #{idx}',
+        location=city,
+        location_key=normalize_location(city),
+        latitude=latitude,
+        longitude=longitude,
+        geohash=encode_geohash(latitude, longitude),
+        price_per_night=round(rng.lognormvariate(5, 0.5), 2),
+        rating=round(rng.uniform(3.5, 5.0), 2),
+        num_reviews=rng.randint(0, 500),
+        description='Synthetic benchmark listing',
+        property_type=rng.choice(PROPERTY_TYPES),
+        capacity=rng.randint(1, 10),
+        bedrooms=rng.randint(1, 5),
+        beds=rng.randint(1, 6),
+        baths=rng.choice([1, 1.5, 2, 2.5, 3]),
+        host=host,
+    )
+
+
+def synthetic_payload(rng, idx):
+    # A validated ListingCreateSerializer payload, as passed to ingest_listings
+    city, latitude, longitude = rng.choice(CITIES)
+    property_type = rng.choice(PROPERTY_TYPES)
+    return {
+        'title': f'{rng.choice(DESCRIPTION_WORDS).title()} {property_type.lower()} in {city}',
+        'location': city,
+        'address': f'{rng.randint(1, 999)} Main Street, {city}',
+        'latitude': latitude + rng.uniform(-0.3, 0.3),
+        'longitude': longitude + rng.uniform(-0.3, 0.3),
+        'price_per_night': round(rng.lognormvariate(5, 0.5), 2),
+        'currency': 'USD',
+        'total_price': None,
+        'rating': round(rng.uniform(3.5, 5.0), 2),
+        'num_reviews': rng.randint(0, 500),
+        'description': ' '.join(rng.choice(DESCRIPTION_WORDS) for _ in range(rng.randint(60, 200))),
+        'property_type': property_type,
+        'capacity': rng.randint(1, 10),
+        'bedrooms': rng.randint(1, 5),
+        'beds': rng.randint(1, 6),
+        'baths': rng.choice([1, 1.5, 2, 2.5, 3]),
+        'check_in': None,
+        'check_out': None,
+        'host_data': {'name': f'Host {rng.randint(1, 5000)}', 'isSuperhost': rng.random() < 0.3},
+        'images': [f'https://a0.muscache.com/im/pictures/{idx}-{n}.jpg' for n in range(rng.randint(5, 25))],
+        'amenities': rng.sample(AMENITIES, rng.randint(3, len(AMENITIES))),
+    }
+
+
+def grow_listings(count, current=0, seed=0, batch_size=5000):
+    # Bulk-insert synthetic listings until there are `count` of them
+    rng = random.Random(seed + current)
+    host, _ = Host.objects.get_or_create(
+        host_key='benchmark', defaults={'name': 'Benchmark host', 'profile_image': ''}
+    )
+    for start in range(current, count, batch_size):
+        Listing.objects.bulk_create([
+            synthetic_listing(rng, host, idx) for idx in range(start, min(start + batch_size, count))
+        ])
+    return count
+
+
+def grow_amenities(current, count, rng, amenities, batch_size=5000):
+    # Give listings current..count (in id order) random amenities, both as
+    # ListingAmenity rows and as the amenity_bits ingest would store
+    listing_ids = Listing.objects.order_by('id').values_list('id', flat=True)[current:count]
+    links = []
+    changed = []
+    for listing_id in listing_ids.iterator(chunk_size=batch_size):
+        chosen = rng.sample(amenities, rng.randint(3, len(amenities) // 2))
+        links += [ListingAmenity(listing_id=listing_id, amenity=amenity) for amenity in chosen]
+        changed.append(Listing(id=listing_id, amenity_bits=amenity_mask(chosen)))
+        if len(changed) >= batch_size:
+            ListingAmenity.objects.bulk_create(links, batch_size=batch_size)
+            Listing.objects.bulk_update(changed, ['amenity_bits'], batch_size=batch_size)
+            links = []
+            changed = []
+    ListingAmenity.objects.bulk_create(links, batch_size=batch_size)
+    Listing.objects.bulk_update(changed, ['amenity_bits'], batch_size=batch_size)
+
+
+def grow_availability(current, count, rng, days=180, batch_size=5000):
+    # Calendars for listings current..count (in id order): free stretches of
+    # a few days to a few weeks between bookings, priced around the listing's
+    # nightly price
+    today = datetime.date.today()
+    listings = Listing.objects.order_by('id').only('id', 'price_per_night')[current:count]
+    rows = []
+    for listing in listings.iterator(chunk_size=batch_size):
+        windows = []
+        day = rng.randint(0, 7)
+        while day < days:
+            nights = rng.randint(2, 30)
+            windows.append({
+                'start': today + datetime.timedelta(days=day),
+                'end': today + datetime.timedelta(days=min(day + nights, days)),
+                'nightly_price': round(float(listing.price_per_night) * rng.choice([1, 1, 1.2, 0.9]), 2),
+            })
+            day += nights + rng.choice([0, 0, rng.randint(1, 10)])
+        rows += build_windows(listing, windows, today)
+        if len(rows) >= batch_size:
+            AvailabilityWindow.objects.bulk_create(rows, batch_size=batch_size)
+            rows = []
+    AvailabilityWindow.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def crawl_payloads(rng, start, count, crawl):
+    # Payloads as the scraper sends them on the `crawl`-th crawl of listings
+    # start..count: photos come from the same CDN URLs every time, a few
+    # change between crawls, and listings of the same building (groups of
+    # four) share some photos
+    payloads = []
+    for idx in range(start, count):
+        listing_rng = random.Random(f'{idx}')
+        payload = synthetic_payload(listing_rng, idx)
+        payload['external_id'] = f'crawl-{idx}'
+        building = idx // 4
+        shared = [f'https://a0.muscache.com/im/pictures/building-{building}-{n}.jpg' for n in range(4)]
+        own = [f'https://a0.muscache.com/im/pictures/{idx}-{n}.jpg' for n in range(listing_rng.randint(4, 20))]
+        # Each crawl replaces about one photo in ten
+        own = [f'{url}?v={crawl}' if rng.random() < 0.1 * min(crawl, 1) else url for url in own]
+        payload['images'] = shared + own
+        payloads.append(payload)
+    return payloads
+
+
+def table_bytes(model):
+    # Data plus index size of a model's table as reported by the database,
+    # or None when it does not say (SQLite without the dbstat table)
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        try:
+            if connection.vendor == 'mysql':
+                cursor.execute('ANALYZE TABLE ' + connection.ops.quote_name(table))
+                cursor.fetchall()
+                cursor.execute('SELECT data_length + index_length FROM information_schema.tables '
+                               'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name IN '
+                               '(SELECT name FROM sqlite_master WHERE tbl_name = %s)', [table])
+            else:
+                return None
+        except Exception:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def format_bytes(size):
+    return 'n/a' if size is None else f'{size / 2 ** 20:8.2f} MB'
+
+
+def measure(func, repeat):
+    # Latency percentiles in milliseconds
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'p50': statistics.median(timings),
+        'p99': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        'mean': statistics.fmean(timings),
+    }
+
+
+def format_timing(label, timing):
+    return f"{label:<32} p50 {timing['p50']:8.2f} ms  p99 {timing['p99']:8.2f} ms"
+
+
+def search(params):
+    queryset = filter_listings(Listing.objects.order_by('-rating', '-id'), QueryDict(params))
+    return lambda: list(queryset[:20])
+
+
+@scenario('geo')
+def bench_geo(stdout, options):
+    rng = random.Random(options['seed'])
+    with scratch_data():
+        current = 0
+        for size in options['sizes']:
+            current = grow_listings(size, current, options['seed'])
+            _, latitude, longitude = rng.choice(CITIES)
+            stdout.write(f'{size} listings')
+            stdout.write(format_timing(
+                '  near (5 km)',
+                measure(search(f'near={latitude},{longitude}&radius_km=5'), options['repeat'])
+            ))
+            stdout.write(format_timing(
+                '  bbox (0.1 deg)',
+                measure(search(f'bbox={longitude},{latitude},{longitude + 0.1},{latitude + 0.1}'),
+                        options['repeat'])
+            ))
+
+
+@scenario('pagination')
+def bench_pagination(stdout, options):
+    page_size = 20
+    deep_page = 5000
+    queryset = Listing.objects.order_by('-rating', '-id')
+    with scratch_data():
+        current = 0
+        for size in options['sizes']:
+            current = grow_listings(size, current, options['seed'])
+            stdout.write(f'{size} listings')
+            for page in (1, deep_page):
+                offset = (page - 1) * page_size
+                if offset >= size:
+                    stdout.write(f'  page {page}: not enough listings')
+                    continue
+
+                stdout.write(format_timing(
+                    f'  page {page} (OFFSET)',
+                    measure(lambda: list(queryset[offset:offset + page_size]), options['repeat'])
+                ))
+
+                # The cursor a client would hold after paging down to here
+                if offset:
+                    last = queryset.values('rating', 'id')[offset - 1]
+                    page_queryset = keyset_filter(queryset, last['rating'], last['id'])
+                else:
+                    page_queryset = queryset
+                stdout.write(format_timing(
+                    f'  page {page} (keyset)',
+                    measure(lambda: list(page_queryset[:page_size]), options['repeat'])
+                ))
+
+
+@scenario('payload')
+def bench_payload(stdout, options):
+    # Full ListingSerializer vs the compact card for one 20-listing page
+    rng = random.Random(options['seed'])
+    renderer = JSONRenderer()
+    with scratch_data():
+        ingest_listings([synthetic_payload(rng, idx) for idx in range(20)])
+
+        results = {}
+        for label, serializer_class in (('full', ListingSerializer), ('card', ListingCardSerializer)):
+            fields = selected_fields(serializer_class, {})
+
+            def render():
+                page = list(listing_queryset(fields)[:20])
+                data = serializer_class(page, many=True, context={'fields': fields}).data
+                return renderer.render(data)
+
+            size = len(render())
+            results[label] = size
+            stdout.write(format_timing(f'{label} ({size} bytes)', measure(render, options['repeat'])))
+
+        stdout.write(f"card payload is {100 * (1 - results['card'] / results['full']):.1f}% smaller")
+
+
+@scenario('serializer')
+def bench_serializer(stdout, options):
+    # DRF serializers vs the .values() fast path for one 20-listing page,
+    # for both the search card and the full listing representation
+    rng = random.Random(options['seed'])
+    with scratch_data():
+        ingest_listings([synthetic_payload(rng, idx) for idx in range(200)])
+
+        for serializer_class in (ListingCardSerializer, ListingSerializer):
+            fields = selected_fields(serializer_class, {})
+            serializer = serializer_class(context={'fields': fields})
+            fast_serializer = FastListingSerializer(serializer)
+
+            def drf_path():
+                page = list(listing_queryset(fields)[:20])
+                data = serializer_class(page, many=True, context={'fields': fields}).data
+                return JSONRenderer().render(data)
+
+            def fast_path():
+                page = fast_serializer.values(listing_queryset(fields))[:20]
+                return FastJSONRenderer().render(fast_serializer.serialize(page))
+
+            identical = drf_path() == fast_path()
+            stdout.write(f'{serializer_class.__name__} (byte-identical: {identical})')
+            for label, func in (('DRF serializer', drf_path), ('fast path', fast_path)):
+                timing = measure(func, options['repeat'])
+                stdout.write(f"{format_timing('  ' + label, timing)}  {1000 / timing['mean']:8.1f} req/s")
+
+
+@scenario('amenities')
+def bench_amenities(stdout, options):
+    # "All of these amenities": one join on ListingAmenity per amenity vs a
+    # bitwise test on Listing.amenity_bits, for the first page and the count
+    rng = random.Random(options['seed'])
+    wanted = ['Wifi', 'Pool', 'Free parking']
+    with scratch_data():
+        amenities = []
+        for name in AMENITIES:
+            amenity, created = Amenity.objects.get_or_create(name=name)
+            if created:
+                assign_bits([amenity])
+            amenities.append(amenity)
+        by_name = {amenity.name: amenity for amenity in amenities}
+
+        current = 0
+        for size in options['sizes']:
+            grow_listings(size, current, options['seed'])
+            grow_amenities(current, size, rng, amenities)
+            current = size
+            stdout.write(f'{size} listings')
+            for count in (1, len(wanted)):
+                names = wanted[:count]
+                joined = Listing.objects.order_by('-rating', '-id')
+                for name in names:
+                    joined = joined.filter(listing_amenities__amenity=by_name[name])
+                bitmap = filter_listings(Listing.objects.order_by('-rating', '-id'),
+                                         QueryDict(f"amenities={','.join(names)}"))
+                label = '+'.join(names)
+                for method, queryset in (('joins', joined), ('bitmap', bitmap)):
+                    stdout.write(format_timing(
+                        f'  {label} page ({method})', measure(lambda: list(queryset[:20]), options['repeat'])
+                    ))
+                    stdout.write(format_timing(
+                        f'  {label} count ({method})', measure(queryset.count, options['repeat'])
+                    ))
+
+
+@scenario('search_docs')
+def bench_search_docs(stdout, options):
+    # One page of a location search built three ways: DRF serializers over
+    # the joined/prefetched listing, the .values() fast path, and the
+    # precomputed cards of ListingSearchDoc
+    rng = random.Random(options['seed'])
+    fields = selected_fields(ListingCardSerializer, {})
+    fast_serializer = FastListingSerializer(ListingCardSerializer(context={'fields': fields}))
+    renderer = FastJSONRenderer()
+    with scratch_data():
+        current = 0
+        for size in options['sizes']:
+            grow_listings(size, current, options['seed'])
+            # Every listing without a doc: the ones just generated and any
+            # already in the database, whatever their ids
+            missing = Listing.objects.exclude(id__in=ListingSearchDoc.objects.values('id'))
+            refresh_search_docs(list(missing.values_list('id', flat=True)))
+            current = size
+
+            params = QueryDict(f'location={rng.choice(CITIES)[0]}&minRating=4')
+
+            def drf_path():
+                page = list(filter_listings(listing_queryset(fields), params)[:20])
+                return renderer.render(ListingCardSerializer(page, many=True, context={'fields': fields}).data)
+
+            def fast_path():
+                page = fast_serializer.values(filter_listings(listing_queryset(fields), params))[:20]
+                return renderer.render(fast_serializer.serialize(page))
+
+            def doc_path():
+                queryset = filter_listings(ListingSearchDoc.objects.order_by('-rating', '-id'), params)
+                return renderer.render(load_cards(queryset.values('card')[:20]))
+
+            identical = drf_path() == doc_path()
+            stdout.write(f'{size} listings (search doc response byte-identical: {identical})')
+            for label, func in (('DRF serializer', drf_path), ('fast path', fast_path), ('search docs', doc_path)):
+                stdout.write(format_timing(f'  {label}', measure(func, options['repeat'])))
+
+
+@scenario('availability')
+def bench_availability(stdout, options):
+    # Date-range searches of increasing stay length: with the calendar index
+    # a 28-night stay should cost the same as a 2-night one
+    rng = random.Random(options['seed'])
+    check_in = datetime.date.today() + datetime.timedelta(days=30)
+    with scratch_data():
+        current = 0
+        for size in options['sizes']:
+            grow_listings(size, current, options['seed'])
+            grow_availability(current, size, rng)
+            current = size
+            stdout.write(f'{size} listings, {AvailabilityWindow.objects.count()} availability windows')
+            for nights in (2, 7, 28):
+                check_out = check_in + datetime.timedelta(days=nights)
+                queryset = filter_listings(Listing.objects.order_by('-rating', '-id'),
+                                           QueryDict(f'checkIn={check_in}&checkOut={check_out}'))
+                stdout.write(format_timing(
+                    f'  {nights} nights page', measure(lambda: list(queryset[:20]), options['repeat'])
+                ))
+                stdout.write(format_timing(
+                    f'  {nights} nights count ({queryset.count()})', measure(queryset.count, options['repeat'])
+                ))
+
+
+@scenario('images')
+def bench_images(stdout, options):
+    # Storage and read cost of listing images after three crawls: URLs
+    # stored once in Image and referenced by id, against the previous layout
+    # of one URL string per ListingImage row (computed from the same data),
+    # and the first THUMBNAIL_IDS images of a page read through ListingImage
+    # or from the ids encoded on the listing
+    rng = random.Random(options['seed'])
+    crawls = 3
+    with scratch_data():
+        current = 0
+        for size in options['sizes']:
+            for crawl in range(crawls):
+                for start in range(current, size, 500):
+                    ingest_listings(crawl_payloads(rng, start, min(start + 500, size), crawl))
+            current = size
+
+            references = ListingImage.objects.count()
+            inline_bytes = ListingImage.objects.aggregate(total=Sum(Length('image__url')))['total'] or 0
+            distinct = Image.objects.count()
+            url_bytes = Image.objects.aggregate(total=Sum(Length('url')))['total'] or 0
+            # URL text plus, for the new layout, the 40 character hash key
+            # and an 8 byte reference per listing image
+            shared_bytes = url_bytes + distinct * 40 + references * 8
+            encoded = Listing.objects.aggregate(total=Sum(Length('image_ids')))['total'] or 0
+            stdout.write(f'{size} listings, {crawls} crawls: {references} listing images, {distinct} distinct URLs')
+            stdout.write(f'  URL per listing image         {format_bytes(inline_bytes)}')
+            stdout.write(f'  Image + references            {format_bytes(shared_bytes)}  '
+                         f'({100 * (1 - shared_bytes / max(inline_bytes, 1)):.1f}% smaller)')
+            stdout.write(f'  encoded first image ids       {format_bytes(encoded)}  '
+                         f'({encoded / max(size, 1):.1f} bytes per listing)')
+            for model in (Image, ListingImage):
+                stdout.write(f'  {model.__name__} table (data + indexes) {format_bytes(table_bytes(model))}')
+
+            listing_ids = list(Listing.objects.order_by('-rating', '-id').values_list('id', flat=True)[:20])
+
+            def through_listing_images():
+                return list(ListingImage.objects.filter(
+                    listing_id__in=listing_ids, position__lt=THUMBNAIL_IDS
+                ).values_list('listing_id', 'image__url'))
+
+            def from_encoded_ids():
+                rows = list(Listing.objects.filter(id__in=listing_ids).values_list('id', 'image_ids'))
+                image_ids = {image_id for _, encoded_ids in rows for image_id in decode_ids(encoded_ids)}
+                return dict(Image.objects.filter(id__in=image_ids).values_list('id', 'url'))
+
+            stdout.write(f'  first {THUMBNAIL_IDS} images of a 20 listing page '
+                         f'({len(through_listing_images())} listing images, {len(from_encoded_ids())} images read)')
+            for label, func in (('via ListingImage', through_listing_images), ('via encoded ids', from_encoded_ids)):
+                stdout.write(format_timing(f'    {label}', measure(func, options['repeat'])))
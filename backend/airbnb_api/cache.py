@@ -0,0 +1,120 @@
+import hashlib
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+# Alias in settings.CACHES; any Django cache backend works (LocMemCache is
+# an in-process LRU with TTL, RedisCache is shared between processes)
+CACHE_ALIAS = 'listings'
+
+VERSION_KEY = 'listings:version'
+HITS_KEY = 'listings:hits'
+MISSES_KEY = 'listings:misses'
+
+
+def listing_cache():
+    return caches[CACHE_ALIAS]
+
+
+def current_version():
+    cache = listing_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1 so that an evicted version key
+        # can never bring back entries written under an older version
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    # Invalidate every cached listing response at once
+    cache = listing_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        current_version()
+
+
+def _count(key):
+    cache = listing_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_cache_stats():
+    cache = listing_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / lookups if lookups else 0.0,
+        'version': current_version(),
+    }
+
+
+def cache_key(request):
+    # Path plus the non-empty query parameters in a canonical order. The host
+    # is included because paginated responses carry absolute links. Works for
+    # DRF and plain Django requests alike.
+    params = sorted(
+        (name, value)
+        for name, values in request.GET.lists()
+        for value in values if value != ''
+    )
+    raw = json.dumps([request.get_host(), request.path, params])
+    return f'listings:{current_version()}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def etag_for(data):
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def cached_response(request, build_response):
+    # Serve a listing read from the cache, building and storing it on a miss,
+    # and answer 304 when the client already holds the current version
+    cache = listing_cache()
+    key = cache_key(request)
+    entry = cache.get(key)
+    if entry is None:
+        _count(MISSES_KEY)
+        response = build_response()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        entry = (etag_for(response.data), response.data)
+        cache.set(key, entry)
+    else:
+        _count(HITS_KEY)
+
+    etag, data = entry
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, headers={'ETag': etag})
+
+
+async def acached_entry(request, build_data):
+    # cached_response() for the async views: returns the (etag, data) entry,
+    # awaiting build_data() on a miss, or None when it returns None
+    cache = listing_cache()
+    key = await sync_to_async(cache_key)(request)
+    entry = await cache.aget(key)
+    if entry is None:
+        await sync_to_async(_count)(MISSES_KEY)
+        data = await build_data()
+        if data is None:
+            return None
+        entry = (etag_for(data), data)
+        await cache.aset(key, entry)
+    else:
+        await sync_to_async(_count)(HITS_KEY)
+    return entry
@@ -0,0 +1,76 @@
+from django.db.models import Count, Max, Min, Q
+from .models import Listing, ListingAmenity
+
+PRICE_BINS = 10
+MAX_PRICE_BINS = 50
+# Lower bounds of the rating buckets, highest first ("4.5+", "4+", ...)
+RATING_BUCKETS = (4.5, 4.0, 3.5, 3.0)
+MAX_AMENITIES = 30
+
+
+def listing_facets(queryset, price_bins=PRICE_BINS):
+    # Filter bar summary of a filtered listing queryset. Everything is
+    # counted by the database: one aggregate for the totals, price range and
+    # rating buckets, one for the price histogram (conditional counts over
+    # bins of the range just read) and one GROUP BY each for property types
+    # and amenities.
+    ids = queryset.order_by().values('id')
+    if queryset.query.group_by is not None:
+        # Text search groups rows to rank them; aggregate over the matches
+        queryset = Listing.objects.filter(id__in=ids)
+    else:
+        queryset = queryset.order_by()
+
+    summary = queryset.aggregate(
+        count=Count('id'),
+        min_price=Min('price_per_night'),
+        max_price=Max('price_per_night'),
+        **{
+            f'rating_{idx}': Count('id', filter=Q(rating__gte=lower))
+            for idx, lower in enumerate(RATING_BUCKETS)
+        }
+    )
+
+    return {
+        'count': summary['count'],
+        'price': {
+            'min': summary['min_price'],
+            'max': summary['max_price'],
+            'histogram': price_histogram(queryset, summary['min_price'], summary['max_price'], price_bins),
+        },
+        'rating': [
+            {'min': lower, 'count': summary[f'rating_{idx}']}
+            for idx, lower in enumerate(RATING_BUCKETS)
+        ],
+        'property_types': [
+            {'value': row['property_type'], 'count': row['count']}
+            for row in queryset.values('property_type').annotate(count=Count('id')).order_by('-count', 'property_type')
+        ],
+        'amenities': [
+            {'value': row['amenity__name'], 'count': row['count']}
+            for row in ListingAmenity.objects.filter(listing__in=ids).values('amenity__name').annotate(
+                count=Count('listing', distinct=True)
+            ).order_by('-count', 'amenity__name')[:MAX_AMENITIES]
+        ],
+    }
+
+
+def price_histogram(queryset, low, high, bins):
+    if low is None:
+        return []
+    if low == high:
+        return [{'min': low, 'max': high, 'count': queryset.count()}]
+
+    width = (high - low) / bins
+    edges = [low + width * idx for idx in range(bins)] + [high]
+    counts = queryset.aggregate(**{
+        # The last bin is closed so that the maximum price is counted
+        f'bin_{idx}': Count('id', filter=Q(price_per_night__gte=edges[idx]) & (
+            Q(price_per_night__lte=edges[idx + 1]) if idx == bins - 1 else Q(price_per_night__lt=edges[idx + 1])
+        ))
+        for idx in range(bins)
+    })
+    return [
+        {'min': edges[idx], 'max': edges[idx + 1], 'count': counts[f'bin_{idx}']}
+        for idx in range(bins)
+    ]
@@ -0,0 +1,169 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import CharField, IntegerField, Value
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+from .images import decode_ids
+from .models import Image, ListingImage, ListingAmenity
+from .metrics import timed
+
+# Serializer fields the fast path knows how to build without model instances
+RELATED_FIELDS = ('host', 'images', 'amenities', 'thumbnail', 'stay_total')
+
+
+def _converter(field):
+    # Plain function equivalent to field.to_representation for non-null
+    # values of the field types the listing serializers use
+    if isinstance(field, serializers.BooleanField):
+        return bool
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, serializers.FloatField):
+        return float
+    if isinstance(field, serializers.CharField):
+        return str
+    # DRF only sets coerce_to_string when it is passed to the field
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if isinstance(field, serializers.DecimalField) and coerce_to_string and not field.localize:
+        return lambda value: '{:f}'.format(field.quantize(
+            value if isinstance(value, Decimal) else Decimal(str(value).strip())
+        ))
+    return field.to_representation
+
+
+class FastListingSerializer:
+    # Builds the same representation as a (field-selected) ListingSerializer
+    # or ListingCardSerializer, but from .values() rows: listing and host
+    # columns come from one query, and images and amenities for the whole
+    # page from one UNION query, without instantiating any model or running
+    # DRF's per-field attribute lookup. A thumbnail on its own is read by
+    # primary key from the image ids stored on the listing row.
+
+    def __init__(self, serializer):
+        self.order = list(serializer.fields)
+        self.columns = [
+            (name, _converter(field)) for name, field in serializer.fields.items()
+            if name not in RELATED_FIELDS
+        ]
+        self.converters = dict(self.columns)
+        self.stay_total = None
+        if 'stay_total' in serializer.fields:
+            self.stay_total = _converter(serializer.fields['stay_total'])
+        self.host_columns = []
+        if 'host' in serializer.fields:
+            self.host_columns = [
+                (name, _converter(field)) for name, field in serializer.fields['host'].fields.items()
+            ]
+
+    def values(self, queryset, extra=()):
+        names = [name for name, _ in self.columns]
+        names += [f'host__{name}' for name, _ in self.host_columns]
+        # id and rating are needed by the keyset cursor
+        names += [name for name in ('id', 'rating', *extra) if name not in names]
+        if self.stay_total is not None and 'stay_total' in queryset.query.annotations:
+            names.append('stay_total')
+        if self.thumbnail_ids():
+            names.append('image_ids')
+        return queryset.prefetch_related(None).values(*names)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        related = self.related_rows(rows)
+        return self.build(rows, list(related) if related is not None else [])
+
+    async def aserialize(self, rows):
+        # serialize() for async views: the same two queries, run with the
+        # async ORM (rows is a list or a .values() queryset)
+        if not isinstance(rows, list):
+            rows = [row async for row in rows]
+        related = self.related_rows(rows)
+        return self.build(rows, [row async for row in related] if related is not None else [])
+
+    def build(self, rows, related):
+        with timed('serialize'):
+            return self._build(rows, related)
+
+    def _build(self, rows, related):
+        images, thumbnails, amenities = self._group_related(rows, related)
+
+        data = []
+        for row in rows:
+            item = {}
+            for name in self.order:
+                if name == 'host':
+                    item['host'] = {
+                        host_name: _convert(row[f'host__{host_name}'], convert)
+                        for host_name, convert in self.host_columns
+                    }
+                elif name == 'images':
+                    item['images'] = images.get(row['id'], [])
+                elif name == 'amenities':
+                    item['amenities'] = amenities.get(row['id'], [])
+                elif name == 'thumbnail':
+                    item['thumbnail'] = thumbnails.get(row['id'])
+                elif name == 'stay_total':
+                    item['stay_total'] = _convert(row.get('stay_total'), self.stay_total)
+                else:
+                    item[name] = _convert(row[name], self.converters[name])
+            data.append(item)
+        return data
+
+    def thumbnail_ids(self):
+        # Whether thumbnails come from the listing's image_ids; with the full
+        # image list they are its first entry
+        return 'thumbnail' in self.order and 'images' not in self.order
+
+    def related_rows(self, rows):
+        # One query for the images and amenities of a page's .values() rows,
+        # or None when there is nothing to load
+        listing_ids = [row['id'] for row in rows]
+        want_amenities = 'amenities' in self.order
+
+        parts = []
+        if 'images' in self.order:
+            parts.append(ListingImage.objects.filter(listing_id__in=listing_ids).order_by().annotate(
+                kind=Value('image', output_field=CharField())
+            ).values_list('listing_id', 'image__url', 'position', 'kind'))
+        elif self.thumbnail_ids():
+            image_ids = {ids[0] for ids in (decode_ids(row['image_ids']) for row in rows) if ids}
+            if image_ids:
+                parts.append(Image.objects.filter(id__in=image_ids).order_by().annotate(
+                    position=Value(0, output_field=IntegerField()),
+                    kind=Value('thumbnail', output_field=CharField())
+                ).values_list('id', 'url', 'position', 'kind'))
+        if want_amenities:
+            queryset = ListingAmenity.objects.filter(listing_id__in=listing_ids)
+            parts.append(queryset.order_by().annotate(
+                kind=Value('amenity', output_field=CharField())
+            ).values_list('listing_id', 'amenity__name', 'id', 'kind'))
+
+        if not listing_ids or not parts:
+            return None
+        return parts[0].union(*parts[1:], all=True) if len(parts) > 1 else parts[0]
+
+    def _group_related(self, rows, related):
+        images = defaultdict(list)
+        thumbnails = {}
+        thumbnail_urls = {}
+        amenities = defaultdict(list)
+        # Same order as the prefetch path: images by position, amenities by
+        # listing amenity id. Thumbnail rows are keyed by image id.
+        for key, value, position, kind in sorted(related, key=lambda row: row[2]):
+            if kind == 'image':
+                images[key].append(value)
+                if position == 0:
+                    thumbnails.setdefault(key, value)
+            elif kind == 'thumbnail':
+                thumbnail_urls[key] = value
+            else:
+                amenities[key].append(value)
+        if thumbnail_urls:
+            for row in rows:
+                ids = decode_ids(row['image_ids'])
+                if ids:
+                    thumbnails[row['id']] = thumbnail_urls.get(ids[0])
+        return images, thumbnails, amenities
+
+
+def _convert(value, convert):
+    return None if value is None else convert(value)
@@ -0,0 +1,108 @@
+import math
+from django.utils.dateparse import parse_date
+from .models import normalize_location
+from .search import search_listings
+from .amenities import filter_amenities
+from .availability import filter_available
+from .geo import distance_km, parse_bbox, parse_point, prefix_q, radius_box, within_box
+
+# Upper bound of the guests filter. Bounding the range on both ends lets
+# planners without range statistics (SQLite) see it as selective and search
+# listing_capacity_idx instead of walking the whole rating index.
+MAX_CAPACITY = 1000
+
+DEFAULT_RADIUS_KM = 10.0
+MAX_RADIUS_KM = 500.0
+
+
+def filter_listings(queryset, params):
+    # Apply the search filters shared by every listing read path
+    
+    # Full-text search, ranked by relevance
+    query = params.get('q')
+    if query:
+        queryset = search_listings(queryset, query)
+    
+    # Filter by location, as a prefix match on the indexed normalized key
+    location = params.get('location')
+    if location:
+        queryset = queryset.filter(prefix_q('location_key', normalize_location(location)))
+    
+    # Filter by check-in and check-out dates against the availability
+    # calendar; matches are annotated with the stay's total price
+    check_in = params.get('checkIn')
+    check_out = params.get('checkOut')
+    if check_in and check_out:
+        check_in_date = parse_date(check_in)
+        check_out_date = parse_date(check_out)
+        if check_in_date and check_out_date:
+            queryset = filter_available(queryset, check_in_date, check_out_date)
+    
+    # Filter by guests
+    guests = params.get('guests')
+    if guests:
+        try:
+            guests_count = int(guests)
+            queryset = queryset.filter(capacity__gte=guests_count, capacity__lte=MAX_CAPACITY)
+        except ValueError:
+            pass
+    
+    # Filter by price range
+    min_price = params.get('minPrice')
+    max_price = params.get('maxPrice')
+    
+    if min_price:
+        try:
+            min_price_value = float(min_price)
+            queryset = queryset.filter(price_per_night__gte=min_price_value)
+        except ValueError:
+            pass
+            
+    if max_price:
+        try:
+            max_price_value = float(max_price)
+            queryset = queryset.filter(price_per_night__lte=max_price_value)
+        except ValueError:
+            pass
+    
+    # Filter by minimum rating
+    min_rating = params.get('minRating')
+    if min_rating:
+        try:
+            rating_value = float(min_rating)
+            queryset = queryset.filter(rating__gte=rating_value)
+        except ValueError:
+            pass
+    
+    # Filter by amenities (comma separated, all required), as a bitwise test
+    amenities = [name.strip() for name in params.get('amenities', '').split(',') if name.strip()]
+    if amenities:
+        queryset = filter_amenities(queryset, amenities)
+    
+    # Filter by map area, nearest first. A radius search takes precedence
+    # over a bounding box; bbox results are ordered by distance to its center.
+    near = parse_point(params.get('near', ''))
+    bbox = parse_bbox(params.get('bbox', ''))
+    if near:
+        try:
+            radius = float(params.get('radius_km', DEFAULT_RADIUS_KM))
+        except ValueError:
+            radius = DEFAULT_RADIUS_KM
+        # nan, inf and non-positive radii fall back to the default too
+        if not (math.isfinite(radius) and radius > 0):
+            radius = DEFAULT_RADIUS_KM
+        radius = min(radius, MAX_RADIUS_KM)
+        queryset = within_box(queryset, *radius_box(near[0], near[1], radius))
+        queryset = queryset.annotate(distance_km=distance_km(*near)).filter(
+            distance_km__lte=radius
+        ).order_by('distance_km', '-id')
+    elif bbox:
+        min_lat, min_lng, max_lat, max_lng = bbox
+        center_lng = (min_lng + max_lng) / 2
+        if min_lng > max_lng:
+            center_lng = center_lng + 180 if center_lng <= 0 else center_lng - 180
+        center = ((min_lat + max_lat) / 2, center_lng)
+        queryset = within_box(queryset, *bbox)
+        queryset = queryset.annotate(distance_km=distance_km(*center)).order_by('distance_km', '-id')
+    
+    return queryset
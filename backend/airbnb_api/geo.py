@@ -0,0 +1,147 @@
+import math
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Upper bound on the number of geohash prefixes a single search expands to
+MAX_COVER_CELLS = 32
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    if latitude is None or longitude is None:
+        return ''
+
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            bounds[0] = mid
+        else:
+            bits = bits * 2
+            bounds[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (height, width) of a geohash cell in degrees
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def cover_cells(min_lat, min_lng, max_lat, max_lng):
+    # Smallest set of same-precision geohash cells (at most MAX_COVER_CELLS)
+    # that covers the box. Each cell becomes an indexed prefix range scan.
+    if min_lng > max_lng:
+        # Box crosses the antimeridian
+        return (cover_cells(min_lat, min_lng, max_lat, 180.0)
+                | cover_cells(min_lat, -180.0, max_lat, max_lng))
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        first_row = math.floor((min_lat + 90) / height)
+        first_col = math.floor((min_lng + 180) / width)
+        rows = math.floor((max_lat + 90) / height) - first_row + 1
+        cols = math.floor((max_lng + 180) / width) - first_col + 1
+        if rows * cols <= MAX_COVER_CELLS or precision == 1:
+            break
+
+    cells = set()
+    for row in range(rows):
+        latitude = min((first_row + row + 0.5) * height - 90, 90.0)
+        for col in range(cols):
+            longitude = min((first_col + col + 0.5) * width - 180, 180.0)
+            cells.add(encode_geohash(latitude, longitude, precision))
+    return cells
+
+
+def radius_box(latitude, longitude, radius_km):
+    # Bounding box (min_lat, min_lng, max_lat, max_lng) around a circle
+    lat_delta = radius_km / KM_PER_DEGREE
+    lng_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    min_lng = longitude - lng_delta
+    max_lng = longitude + lng_delta
+    if lng_delta >= 180:
+        min_lng, max_lng = -180.0, 180.0
+    else:
+        min_lng = min_lng + 360 if min_lng < -180 else min_lng
+        max_lng = max_lng - 360 if max_lng > 180 else max_lng
+    return (max(latitude - lat_delta, -90.0), min_lng,
+            min(latitude + lat_delta, 90.0), max_lng)
+
+
+def prefix_q(field, prefix):
+    # Rows whose field starts with prefix, in a form the field's index can
+    # serve. SQLite's LIKE is case-insensitive and so never uses a (binary)
+    # index; the equivalent half-open range does. MySQL turns LIKE 'x%' into
+    # a range itself, and a range there would depend on the collation.
+    if connection.vendor == 'sqlite' and prefix:
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1)})
+    return Q(**{f'{field}__startswith': prefix})
+
+
+def within_box(queryset, min_lat, min_lng, max_lat, max_lng):
+    cells = Q()
+    for cell in cover_cells(min_lat, min_lng, max_lat, max_lng):
+        cells |= prefix_q('geohash', cell)
+
+    if min_lng > max_lng:
+        longitudes = Q(longitude__gte=min_lng) | Q(longitude__lte=max_lng)
+    else:
+        longitudes = Q(longitude__gte=min_lng, longitude__lte=max_lng)
+    return queryset.filter(cells, longitudes, latitude__gte=min_lat, latitude__lte=max_lat)
+
+
+def distance_km(latitude, longitude):
+    # Haversine distance from a fixed point to each row, computed in SQL
+    lat_delta = Radians(F('latitude') - latitude)
+    lng_delta = Radians(F('longitude') - longitude)
+    a = (Power(Sin(lat_delta / 2), 2)
+         + math.cos(math.radians(latitude)) * Cos(Radians(F('latitude'))) * Power(Sin(lng_delta / 2), 2))
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a))
+
+
+def parse_point(value):
+    # "lat,lng" -> (lat, lng), or None if malformed
+    try:
+        latitude, longitude = (float(part) for part in value.split(','))
+    except ValueError:
+        return None
+    if not all(math.isfinite(part) for part in (latitude, longitude)):
+        return None
+    if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+        return latitude, longitude
+    return None
+
+
+def parse_bbox(value):
+    # "min_lng,min_lat,max_lng,max_lat" (GeoJSON order) -> box, or None
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        return None
+    if not all(math.isfinite(part) for part in (min_lng, min_lat, max_lng, max_lat)):
+        return None
+    if -90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= 180 and -180 <= max_lng <= 180:
+        return min_lat, min_lng, max_lat, max_lng
+    return None
@@ -0,0 +1,45 @@
+import hashlib
+
+# Images are stored once per distinct URL (Image, keyed by a hash of the
+# URL) and listings reference them by position (ListingImage). Each listing
+# also keeps the ids of its first THUMBNAIL_IDS images in image_ids, encoded
+# by encode_ids, so that thumbnails are read from the listing row and the
+# Image primary key without touching ListingImage.
+
+THUMBNAIL_IDS = 5
+
+
+def url_hash(url):
+    # Fixed-width key for the unique index; URLs are too long to index well
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+def encode_ids(ids):
+    # Ordered ids as the zigzag-encoded differences between neighbours, each
+    # written as a base-128 varint: ids of images first seen together are
+    # close, so most take one or two bytes instead of eight
+    data = bytearray()
+    previous = 0
+    for value in ids:
+        delta = value - previous
+        previous = value
+        delta = delta * 2 if delta >= 0 else -delta * 2 - 1
+        while delta >= 0x80:
+            data.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return bytes(data)
+
+
+def decode_ids(data):
+    ids = []
+    previous = 0
+    delta = shift = 0
+    for byte in bytes(data or b''):
+        delta |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            previous += delta // 2 if delta % 2 == 0 else -(delta + 1) // 2
+            ids.append(previous)
+            delta = shift = 0
+    return ids
@@ -0,0 +1,302 @@
+import hashlib
+import json
+from collections import defaultdict
+from django.db import connection, transaction
+from .geo import encode_geohash
+from .amenities import amenity_mask, assign_bits
+from .availability import build_windows
+from .images import THUMBNAIL_IDS, encode_ids, url_hash
+from .models import (normalize_location, Host, Listing, Image, ListingImage, Amenity, ListingAmenity,
+                     AvailabilityWindow)
+from .search import index_listings
+from .search_docs import refresh_search_docs
+from .cache import bump_version
+
+RELATED_FIELDS = ('host_data', 'images', 'amenities', 'availability')
+
+HOST_UPDATE_FIELDS = ['name', 'is_superhost', 'profile_image', 'response_rate',
+                      'response_time', 'join_date', 'updated_at']
+
+# Everything an upsert may overwrite on an existing listing
+LISTING_UPDATE_FIELDS = [
+    field.name for field in Listing._meta.concrete_fields
+    if field.name not in ('id', 'external_id', 'created_at')
+]
+
+BATCH_SIZE = 500
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+
+
+def ingest_listings(items):
+    # Write a batch of validated ListingCreateSerializer payloads in a single
+    # transaction. Listings with an external_id are upserted on it: unchanged
+    # ones cost no writes at all, changed ones are updated in place and have
+    # their images and amenities diffed. Returns (listing, status) pairs in
+    # the same order as items.
+    if not items:
+        return []
+
+    hashes = [payload_hash(item) for item in items]
+    with transaction.atomic():
+        # Last occurrence wins when a batch repeats an external_id
+        keyed = {}
+        for idx, item in enumerate(items):
+            if item.get('external_id'):
+                keyed[item['external_id']] = idx
+        existing = {
+            listing.external_id: listing
+            for chunk in chunked(keyed)
+            for listing in Listing.objects.filter(
+                external_id__in=chunk
+            ).only('id', 'external_id', 'content_hash')
+        }
+
+        results = [None] * len(items)
+        to_write = []
+        for external_id, idx in keyed.items():
+            listing = existing.get(external_id)
+            if listing is not None and listing.content_hash == hashes[idx]:
+                results[idx] = (listing, UNCHANGED)
+            else:
+                to_write.append(idx)
+        to_write += [idx for idx, item in enumerate(items) if not item.get('external_id')]
+        to_write.sort()
+
+        if to_write:
+            hosts = _resolve_hosts([items[idx]['host_data'] for idx in to_write])
+            amenities = _resolve_amenities({name for idx in to_write for name in items[idx]['amenities']})
+            images = _resolve_images({url for idx in to_write for url in items[idx]['images']})
+            listings = {
+                idx: _build_listing(items[idx], hashes[idx], hosts[host_key(items[idx]['host_data'])],
+                                    amenities, images)
+                for idx in to_write
+            }
+
+            upserts = [listings[idx] for idx in to_write if items[idx].get('external_id')]
+            if upserts:
+                _bulk_upsert(Listing, upserts, 'external_id', LISTING_UPDATE_FIELDS)
+            _create_listings([listings[idx] for idx in to_write if not items[idx].get('external_id')])
+
+            for idx in to_write:
+                external_id = items[idx].get('external_id')
+                results[idx] = (listings[idx], UPDATED if external_id in existing else CREATED)
+
+            written = [listings[idx] for idx in to_write]
+            index_listings(written)
+            _sync_images(written, [items[idx]['images'] for idx in to_write], images)
+            _sync_amenities(written, [items[idx]['amenities'] for idx in to_write], amenities)
+            _sync_availability(written, [items[idx].get('availability') for idx in to_write])
+            refresh_search_docs([listing.pk for listing in written])
+
+            # Cached search responses are stale once this batch is visible
+            transaction.on_commit(bump_version)
+
+        # Earlier duplicates of an external_id report the row it ended up in
+        for idx, item in enumerate(items):
+            if results[idx] is None:
+                results[idx] = results[keyed[item['external_id']]]
+
+    return results
+
+
+def chunked(values):
+    # Lists of at most BATCH_SIZE values, for __in lookups that would
+    # otherwise go over the backends' parameter limits on large batches
+    values = list(values)
+    for start in range(0, len(values), BATCH_SIZE):
+        yield values[start:start + BATCH_SIZE]
+
+
+def payload_hash(item):
+    return hashlib.sha1(json.dumps(item, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def host_key(host_data):
+    # Airbnb's host id when the scraper has it, otherwise name and avatar
+    # together, so different hosts sharing a first name stay apart
+    if host_data.get('id'):
+        return f"airbnb:{host_data['id']}"
+    raw = f"{host_data.get('name', '')}|{host_data.get('profileImage', '')}"
+    return f"name:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def _build_listing(item, digest, host, amenities, images):
+    fields = {key: value for key, value in item.items() if key not in RELATED_FIELDS}
+    fields['location_key'] = normalize_location(fields.get('location'))
+    fields['geohash'] = encode_geohash(fields.get('latitude'), fields.get('longitude'))
+    fields['amenity_bits'] = amenity_mask(amenities[name] for name in item['amenities'])
+    fields['image_ids'] = encode_ids(images[url].pk for url in item['images'][:THUMBNAIL_IDS])
+    fields['content_hash'] = digest
+    return Listing(host=host, **fields)
+
+
+def _host_fields(host_data):
+    return {
+        'name': host_data.get('name'),
+        'is_superhost': host_data.get('isSuperhost', False),
+        'profile_image': host_data.get('profileImage', ''),
+        'response_rate': host_data.get('responseRate'),
+        'response_time': host_data.get('responseTime'),
+        'join_date': host_data.get('joinDate'),
+    }
+
+
+def _resolve_hosts(hosts_data):
+    # One lookup for the whole batch, then upsert only new or changed hosts
+    by_key = {}
+    for host_data in hosts_data:
+        by_key[host_key(host_data)] = _host_fields(host_data)
+
+    hosts = {
+        host.host_key: host
+        for chunk in chunked(by_key) for host in Host.objects.filter(host_key__in=chunk)
+    }
+    changed = [
+        Host(host_key=key, **fields) for key, fields in by_key.items()
+        if key not in hosts or any(getattr(hosts[key], name) != value for name, value in fields.items())
+    ]
+    if changed:
+        hosts.update(_bulk_upsert(Host, changed, 'host_key', HOST_UPDATE_FIELDS))
+    return hosts
+
+
+def _resolve_amenities(names):
+    amenities = {
+        amenity.name: amenity
+        for chunk in chunked(names) for amenity in Amenity.objects.filter(name__in=chunk)
+    }
+    missing = [Amenity(name=name) for name in names if name not in amenities]
+    if missing:
+        amenities.update(_bulk_upsert(Amenity, missing, 'name'))
+        # No stored listing has a new amenity yet, so its bit is valid
+        # straight away; existing amenities get theirs from
+        # rebuild_amenity_bits, which also backfills the listings
+        assign_bits(missing)
+    return amenities
+
+
+def _resolve_images(urls):
+    # Image rows for the batch's URLs, inserting the ones never seen before.
+    # Re-crawls and listings sharing photos mostly find theirs already there.
+    # Looked up in chunks to stay under the backends' parameter limits.
+    by_hash = {url_hash(url): url for url in urls}
+    hashes = list(by_hash)
+    images = {}
+    for start in range(0, len(hashes), BATCH_SIZE):
+        chunk = hashes[start:start + BATCH_SIZE]
+        found = {image.url_hash: image for image in Image.objects.filter(url_hash__in=chunk)}
+        missing = [Image(url_hash=key, url=by_hash[key]) for key in chunk if key not in found]
+        if missing:
+            found.update(_bulk_upsert(Image, missing, 'url_hash'))
+        images.update((by_hash[key], image) for key, image in found.items())
+    return images
+
+
+def _bulk_upsert(model, objs, key, update_fields=None):
+    # Insert objs, updating update_fields of rows whose unique key already
+    # exists (or leaving them alone without update_fields). Primary keys are
+    # read back by key, since MySQL never returns them from a multi-row
+    # INSERT and no backend returns them for updated rows.
+    if update_fields:
+        options = {'update_conflicts': True, 'update_fields': update_fields}
+        if connection.features.supports_update_conflicts_with_target:
+            options['unique_fields'] = [key]
+    else:
+        options = {'ignore_conflicts': True}
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE, **options)
+
+    ids = {}
+    for chunk in chunked(getattr(obj, key) for obj in objs):
+        ids.update(model.objects.filter(**{f'{key}__in': chunk}).values_list(key, 'id'))
+    for obj in objs:
+        obj.pk = ids[getattr(obj, key)]
+    return {getattr(obj, key): obj for obj in objs}
+
+
+def _create_listings(listings):
+    if not listings:
+        return
+    if connection.features.can_return_rows_from_bulk_insert:
+        Listing.objects.bulk_create(listings, batch_size=BATCH_SIZE)
+        return
+
+    # Listings without an external_id have no natural key to read them back
+    # by, so on backends that do not return primary keys they are inserted
+    # one at a time
+    for listing in listings:
+        listing.save(force_insert=True)
+
+
+def _sync_images(listings, images_per_listing, images):
+    # Bring each listing's images to the given ordered URL list, touching
+    # only the rows that differ. Images no longer used by any listing are
+    # left in place; they are small and often come back on the next crawl.
+    current = defaultdict(lambda: defaultdict(list))
+    for chunk in chunked(listings):
+        for listing_image in ListingImage.objects.filter(listing__in=chunk).order_by('position', 'id'):
+            current[listing_image.listing_id][listing_image.image_id].append(listing_image)
+
+    to_create = []
+    to_move = []
+    to_delete = []
+    for listing, image_urls in zip(listings, images_per_listing):
+        existing = current.pop(listing.pk, {})
+        for position, image_url in enumerate(image_urls):
+            image_id = images[image_url].pk
+            matches = existing.get(image_id)
+            if matches:
+                listing_image = matches.pop(0)
+                if listing_image.position != position:
+                    listing_image.position = position
+                    to_move.append(listing_image)
+            else:
+                to_create.append(ListingImage(listing=listing, image_id=image_id, position=position))
+        to_delete += [listing_image.pk for matches in existing.values() for listing_image in matches]
+
+    for chunk in chunked(to_delete):
+        ListingImage.objects.filter(pk__in=chunk).delete()
+    if to_move:
+        ListingImage.objects.bulk_update(to_move, ['position'], batch_size=BATCH_SIZE)
+    ListingImage.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+
+
+def _sync_amenities(listings, amenities_per_listing, amenities):
+    current = defaultdict(dict)
+    for chunk in chunked(listings):
+        for listing_amenity in ListingAmenity.objects.filter(listing__in=chunk):
+            current[listing_amenity.listing_id][listing_amenity.amenity_id] = listing_amenity.pk
+
+    to_create = []
+    to_delete = []
+    for listing, names in zip(listings, amenities_per_listing):
+        existing = current.pop(listing.pk, {})
+        wanted = {amenities[name].pk for name in names}
+        to_create += [
+            ListingAmenity(listing=listing, amenity_id=amenity_id)
+            for amenity_id in dict.fromkeys(amenities[name].pk for name in names)
+            if amenity_id not in existing
+        ]
+        to_delete += [pk for amenity_id, pk in existing.items() if amenity_id not in wanted]
+
+    for chunk in chunked(to_delete):
+        ListingAmenity.objects.filter(pk__in=chunk).delete()
+    ListingAmenity.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+
+
+def _sync_availability(listings, availability_per_listing):
+    # A payload's calendar replaces the stored one; payloads without one
+    # leave it as it is. Calendars change as a whole when a listing is
+    # booked, so there is nothing to gain from diffing the windows.
+    replaced = [listing for listing, windows in zip(listings, availability_per_listing) if windows is not None]
+    if not replaced:
+        return
+    for chunk in chunked(replaced):
+        AvailabilityWindow.objects.filter(listing__in=chunk).delete()
+    AvailabilityWindow.objects.bulk_create([
+        row
+        for listing, windows in zip(listings, availability_per_listing) if windows is not None
+        for row in build_windows(listing, windows)
+    ], batch_size=BATCH_SIZE)
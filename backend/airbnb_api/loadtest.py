@@ -0,0 +1,243 @@
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from .benchmarks import AMENITIES, CITIES, DESCRIPTION_WORDS, synthetic_payload
+
+
+class PooledWSGIServer(ThreadingMixIn, WSGIServer):
+    # Serves requests from a fixed set of worker threads, like a threaded
+    # gunicorn worker. Django connections are per thread, so persistent
+    # connections are only reused when threads are.
+    workers = 16
+
+    def process_request(self, request, client_address):
+        if not hasattr(self, 'executor'):
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        if hasattr(self, 'executor'):
+            self.executor.shutdown(wait=True)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(workers, conn_max_age):
+    # The setting is read whenever a thread opens its connection, so every
+    # run gets a fresh server (and fresh worker threads)
+    connections.settings['default']['CONN_MAX_AGE'] = conn_max_age
+    server_class = type('LoadTestServer', (PooledWSGIServer,), {'workers': workers})
+    server = make_server('127.0.0.1', 0, get_wsgi_application(),
+                         server_class=server_class, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_asgi_server():
+    # The project under uvicorn in a child process: a single event loop
+    # serving the async views. Persistent connections are disabled since
+    # async views get a new thread, and so a new connection, per request.
+    port = free_port()
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'django_backend.settings'),
+               DB_CONN_MAX_AGE='0')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'django_backend.asgi:application',
+         '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=str(settings.BASE_DIR), env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('uvicorn exited; is it installed? (pip install uvicorn)')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('uvicorn did not start within 30 seconds')
+
+
+# Weighted search mix replayed by the search_mix endpoint: (label, weight)
+SEARCH_MIX = [
+    ('location', 30),
+    ('price_guests', 20),
+    ('amenities', 15),
+    ('near', 10),
+    ('bbox', 5),
+    ('text', 10),
+    ('deep_page', 5),
+    ('facets', 5),
+]
+
+SERVER_TIMING_QUERIES = re.compile(r'db;dur=([0-9.]+);desc="(\d+) queries"')
+
+
+def request_factory(base_url, rng, burst_size=100):
+    # Builders of (label, request) pairs for each endpoint. Search
+    # parameters vary so that most reads miss the response cache and reach
+    # the database.
+    counter = iter(range(10 ** 9))
+
+    def post(path, payload):
+        return urllib.request.Request(
+            f'{base_url}{path}', data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST'
+        )
+
+    def payload():
+        item = synthetic_payload(rng, next(counter))
+        item['images'] = item['images'][:5]
+        return item
+
+    def get(path, **params):
+        return urllib.request.Request(f'{base_url}{path}?{urllib.parse.urlencode(params)}')
+
+    def add_listing():
+        return 'add_listing', post('/api/add_listing/', payload())
+
+    def ingest_burst():
+        # A scraper flush: one bulk request, with external ids so that
+        # repeated runs exercise the upsert path too
+        batch = []
+        for _ in range(burst_size):
+            item = payload()
+            item['external_id'] = f'loadtest-{rng.randint(1, 10 ** 6)}'
+            batch.append(item)
+        return 'ingest_burst', post('/api/add_listings_bulk/', batch)
+
+    def search(path):
+        def build():
+            city = rng.choice(CITIES)[0]
+            return 'listings', get(path, location=city, minPrice=rng.randint(1, 500))
+        return build
+
+    def search_mix():
+        label = rng.choices([name for name, _ in SEARCH_MIX], [weight for _, weight in SEARCH_MIX])[0]
+        city, latitude, longitude = rng.choice(CITIES)
+        if label == 'location':
+            params = {'location': city, 'minPrice': rng.randint(1, 300)}
+        elif label == 'price_guests':
+            low = rng.randint(20, 300)
+            params = {'minPrice': low, 'maxPrice': low + rng.randint(50, 500), 'guests': rng.randint(1, 8)}
+        elif label == 'amenities':
+            params = {'amenities': ','.join(rng.sample(AMENITIES, rng.randint(1, 3))), 'location': city}
+        elif label == 'near':
+            params = {'near': f'{latitude},{longitude}', 'radius_km': rng.choice([2, 5, 10, 25])}
+        elif label == 'bbox':
+            size = rng.uniform(0.02, 0.2)
+            params = {'bbox': f'{longitude},{latitude},{longitude + size},{latitude + size}'}
+        elif label == 'text':
+            params = {'q': ' '.join(rng.sample(DESCRIPTION_WORDS, rng.randint(1, 2)))}
+        elif label == 'deep_page':
+            params = {'page': rng.randint(2, 50), 'minRating': round(rng.uniform(3.5, 4.8), 1)}
+        else:
+            return label, get('/api/listings/facets/', location=city, minRating=rng.choice([0, 4, 4.5]))
+        return label, get('/api/listings/', **params)
+
+    return {
+        'add_listing': add_listing,
+        'ingest_burst': ingest_burst,
+        'listings': search('/api/listings/'),
+        'async_listings': search('/api/async/listings/'),
+        'search_mix': search_mix,
+    }
+
+
+def send(labeled_request):
+    # (label, latency ms, ok, queries, db ms); the query count and DB time
+    # come from the Server-Timing header when the server sends one
+    label, request = labeled_request
+    queries = db_ms = None
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            ok = response.status < 400
+            match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+            if match:
+                db_ms, queries = float(match.group(1)), int(match.group(2))
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return label, (time.perf_counter() - started) * 1000, ok, queries, db_ms
+
+
+def percentile(timings, fraction):
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def summarize(results, elapsed):
+    timings = sorted(timing for _, timing, _, _, _ in results)
+    queries = [count for _, _, _, count, _ in results if count is not None]
+    db_times = [db_ms for _, _, _, _, db_ms in results if db_ms is not None]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, _, ok, _, _ in results if not ok),
+        'throughput': len(results) / elapsed,
+        'mean': statistics.fmean(timings),
+        'p50': percentile(timings, 0.5),
+        'p90': percentile(timings, 0.9),
+        'p95': percentile(timings, 0.95),
+        'p99': percentile(timings, 0.99),
+        'max': timings[-1],
+        'queries_mean': statistics.fmean(queries) if queries else None,
+        'queries_max': max(queries) if queries else None,
+        'db_ms_mean': statistics.fmean(db_times) if db_times else None,
+    }
+
+
+def run_load(base_url, endpoint, total, concurrency, seed=0, burst_size=100):
+    # `total` requests to one endpoint from `concurrency` client threads.
+    # Throughput of each label in a mix is its share of the whole run.
+    rng = random.Random(seed)
+    build = request_factory(base_url, rng, burst_size)[endpoint]
+    requests = [build() for _ in range(total)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, requests))
+    elapsed = time.perf_counter() - started
+
+    by_label = defaultdict(list)
+    for result in results:
+        by_label[result[0]].append(result)
+    summary = summarize(results, elapsed)
+    summary['endpoint'] = endpoint
+    if len(by_label) > 1:
+        summary['labels'] = {label: summarize(rows, elapsed) for label, rows in sorted(by_label.items())}
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=str(settings.BASE_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
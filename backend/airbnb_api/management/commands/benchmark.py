@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from airbnb_api.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = ('Run a backend benchmark scenario. Synthetic data is written inside a '
+            'transaction that is rolled back afterwards; use a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma-separated listing counts to measure at')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per measurement')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        options['sizes'] = [int(size) for size in options['sizes'].split(',')]
+        SCENARIOS[options['scenario']](self.stdout, options)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from airbnb_api.search_plans import FULL_SCAN, SORT, check_search_plans, supported
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN the listing search queries and fail if any of them falls back '
+            'to a full table or index scan. Run it against a populated database, as planners '
+            'prefer full scans on near-empty tables.')
+
+    def handle(self, *args, **options):
+        if not supported():
+            raise CommandError(f'Unsupported database backend: {connection.vendor}')
+
+        failures = []
+        for search, status, plan in check_search_plans():
+            if status == FULL_SCAN:
+                failures.append(search)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {search}'))
+                self.stdout.write(plan)
+            elif status == SORT:
+                self.stdout.write(self.style.WARNING(f'SORT       {search}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'OK         {search}'))
+
+        if failures:
+            raise CommandError(f'{len(failures)} search queries fall back to a full scan')
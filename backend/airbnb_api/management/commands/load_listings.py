@@ -0,0 +1,94 @@
+import os
+import gzip
+import json
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from airbnb_api.ingest import ingest_listings
+from airbnb_api.serializers import ListingCreateSerializer
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXTENSIONS = ('.ndjson.gz', '.ndjson', '.jsonl', '.parquet')
+
+# Scraper item keys that are named differently in the ingestion payload
+SCRAPED_KEYS = {'host': 'host_data', 'reviews': 'num_reviews'}
+
+
+def listing_files(paths):
+    # Completed sink files only; .part files are still being written
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(EXTENSIONS):
+                    yield os.path.join(path, name)
+        elif path.endswith(EXTENSIONS):
+            yield path
+        else:
+            raise CommandError(f'Unsupported file type: {path}')
+
+
+def read_listings(path, batch_size):
+    # Yields the listings in a file one at a time, reading at most
+    # batch_size rows of a Parquet file into memory at once
+    if path.endswith('.parquet'):
+        if pyarrow is None:
+            raise CommandError('Reading Parquet files requires pyarrow (pip install pyarrow)')
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+            for row in record_batch.to_pylist():
+                row['host'] = json.loads(row['host']) if row.get('host') else {}
+                # Listings scraped without a calendar keep their stored one
+                if row.get('availability') is None:
+                    row.pop('availability', None)
+                yield row
+        return
+
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as listings_file:
+        for line in listings_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def to_payload(item):
+    return {SCRAPED_KEYS.get(key, key): value for key, value in item.items()}
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load listings written by the scraper file sinks (NDJSON or Parquet)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Files or directories of sink output')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        totals = Counter()
+        for path in listing_files(options['paths']):
+            counts = Counter()
+            batch = []
+            for item in read_listings(path, batch_size):
+                serializer = ListingCreateSerializer(data=to_payload(item))
+                if serializer.is_valid():
+                    batch.append(serializer.validated_data)
+                else:
+                    counts['errors'] += 1
+                    self.stderr.write(f'{path}: skipped {item.get("external_id") or item.get("title")}: '
+                                      f'{serializer.errors}')
+                if len(batch) >= batch_size:
+                    counts.update(status for _, status in ingest_listings(batch))
+                    batch = []
+            if batch:
+                counts.update(status for _, status in ingest_listings(batch))
+
+            totals.update(counts)
+            self.stdout.write(f'{path}: {self._format(counts)}')
+
+        self.stdout.write(self.style.SUCCESS(f'Loaded listings: {self._format(totals)}'))
+
+    def _format(self, counts):
+        return (f"{counts['created']} created, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged, {counts['errors']} errors")
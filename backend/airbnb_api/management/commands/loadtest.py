@@ -0,0 +1,86 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from airbnb_api.loadtest import git_commit, run_load, start_asgi_server, start_server
+from airbnb_api.models import Listing
+
+
+def parse_max_age(value):
+    return None if value.lower() == 'none' else int(value)
+
+
+class Command(BaseCommand):
+    help = ('HTTP load test of the search and ingestion endpoints against an in-process '
+            'threaded server, once per CONN_MAX_AGE value. Writes listings; use a scratch database '
+            '(see generate_listings).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default='search_mix,add_listing,ingest_burst',
+                            help='Comma-separated endpoints to load (search_mix, listings, async_listings, '
+                                 'add_listing, ingest_burst)')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and run')
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent client threads')
+        parser.add_argument('--workers', type=int, default=16, help='Server worker threads')
+        parser.add_argument('--conn-max-age', default='0,60',
+                            help='Comma-separated CONN_MAX_AGE values to compare (0 = new connection per request)')
+        parser.add_argument('--burst-size', type=int, default=100, help='Listings per ingest_burst request')
+        parser.add_argument('--asgi', action='store_true',
+                            help='Also load the async search view under uvicorn (WSGI vs ASGI)')
+        parser.add_argument('--output', help='Write the results as JSON to this file, for diffing across commits')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        endpoints = options['endpoints'].split(',')
+        report = {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'listings': Listing.objects.count(),
+            'options': {name: options[name] for name in (
+                'endpoints', 'requests', 'concurrency', 'workers', 'conn_max_age', 'burst_size', 'seed'
+            )},
+            'runs': [],
+        }
+
+        for conn_max_age in [parse_max_age(value) for value in options['conn_max_age'].split(',')]:
+            server = start_server(options['workers'], conn_max_age)
+            base_url = f'http://127.0.0.1:{server.server_address[1]}'
+            self.stdout.write(f'CONN_MAX_AGE={conn_max_age} ({options["workers"]} server threads, '
+                              f'{options["concurrency"]} clients)')
+            run = {'server': 'wsgi', 'conn_max_age': conn_max_age, 'results': []}
+            for endpoint in endpoints:
+                result = run_load(base_url, endpoint, options['requests'], options['concurrency'],
+                                  options['seed'], options['burst_size'])
+                self.report(result)
+                run['results'].append(result)
+            server.shutdown()
+            server.server_close()
+            report['runs'].append(run)
+
+        if options['asgi']:
+            process, base_url = start_asgi_server()
+            self.stdout.write(f'ASGI (uvicorn, one event loop, {options["concurrency"]} clients)')
+            try:
+                result = run_load(base_url, 'async_listings', options['requests'],
+                                  options['concurrency'], options['seed'])
+                self.report(result)
+                report['runs'].append({'server': 'asgi', 'conn_max_age': 0, 'results': [result]})
+            finally:
+                process.terminate()
+                process.wait()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+
+    def report(self, result):
+        self.stdout.write(self.format(result['endpoint'], result, '  '))
+        for label, summary in result.get('labels', {}).items():
+            self.stdout.write(self.format(label, summary, '    '))
+
+    def format(self, name, result, indent):
+        queries = '' if result['queries_mean'] is None else f"  {result['queries_mean']:5.1f} queries"
+        return (f"{indent}{name:<14} {result['throughput']:8.1f} req/s  p50 {result['p50']:8.2f} ms  "
+                f"p95 {result['p95']:8.2f} ms  p99 {result['p99']:8.2f} ms{queries}  errors {result['errors']}")
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models import Count
+from django.core.management.base import BaseCommand
+from airbnb_api.amenities import MAX_AMENITY_BITS
+from airbnb_api.cache import bump_version
+from airbnb_api.models import Amenity, Listing, ListingAmenity, ListingSearchDoc
+
+
+class Command(BaseCommand):
+    help = 'Give the most common amenities a bit and recompute every listing\'s amenity bitset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            # The most used amenities benefit most from the bitwise filter
+            amenities = list(Amenity.objects.annotate(
+                listings=Count('listingamenity')
+            ).order_by('-listings', 'id'))
+            for position, amenity in enumerate(amenities):
+                amenity.bit = position if position < MAX_AMENITY_BITS else None
+            # Clear first so that reassigned bits never collide on the unique index
+            Amenity.objects.update(bit=None)
+            Amenity.objects.bulk_update(amenities, ['bit'], batch_size=batch_size)
+            bits = {amenity.id: amenity.bit for amenity in amenities}
+
+            masks = {}
+            rows = ListingAmenity.objects.values_list('listing_id', 'amenity_id')
+            for listing_id, amenity_id in rows.iterator(chunk_size=batch_size * 10):
+                if bits[amenity_id] is not None:
+                    masks[listing_id] = masks.get(listing_id, 0) | (1 << bits[amenity_id])
+
+            for model in (Listing, ListingSearchDoc):
+                batch = []
+                for listing_id in model.objects.values_list('id', flat=True).iterator(chunk_size=batch_size):
+                    batch.append(model(id=listing_id, amenity_bits=masks.get(listing_id, 0)))
+                    if len(batch) >= batch_size:
+                        model.objects.bulk_update(batch, ['amenity_bits'])
+                        batch = []
+                if batch:
+                    model.objects.bulk_update(batch, ['amenity_bits'])
+            updated = len(masks)
+            # Cached responses and ETags predate the new bitsets
+            transaction.on_commit(bump_version)
+
+        with_bits = min(len(amenities), MAX_AMENITY_BITS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Assigned bits to {with_bits} of {len(amenities)} amenities; {updated} listings have amenities'
+        ))
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.core.management.base import BaseCommand
+from airbnb_api.cache import bump_version
+from airbnb_api.images import THUMBNAIL_IDS, encode_ids
+from airbnb_api.models import Image, Listing, ListingImage
+from airbnb_api.search_docs import rebuild_search_docs
+
+
+class Command(BaseCommand):
+    help = ('Recompute every listing\'s encoded first image ids from ListingImage (migration 0009 '
+            'fills them when moving image URLs into Image), optionally deleting images no listing uses')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--prune', action='store_true', help='Delete images no listing references')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            first_images = {}
+            rows = ListingImage.objects.filter(position__lt=THUMBNAIL_IDS).order_by(
+                'listing_id', 'position', 'id'
+            ).values_list('listing_id', 'image_id')
+            for listing_id, image_id in rows.iterator(chunk_size=batch_size * 10):
+                first_images.setdefault(listing_id, []).append(image_id)
+
+            batch = []
+            for listing_id in Listing.objects.values_list('id', flat=True).iterator(chunk_size=batch_size):
+                batch.append(Listing(id=listing_id, image_ids=encode_ids(first_images.get(listing_id, []))))
+                if len(batch) >= batch_size:
+                    Listing.objects.bulk_update(batch, ['image_ids'])
+                    batch = []
+            if batch:
+                Listing.objects.bulk_update(batch, ['image_ids'])
+
+            pruned = 0
+            if options['prune']:
+                pruned, _ = Image.objects.filter(listing_images__isnull=True).delete()
+
+            # Search cards carry the thumbnail
+            refreshed, _ = rebuild_search_docs(batch_size)
+            # Cached responses and ETags predate the new thumbnails
+            transaction.on_commit(bump_version)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Encoded image ids for {len(first_images)} listings, refreshed {refreshed} search docs, '
+            f'pruned {pruned} unused images'
+        ))
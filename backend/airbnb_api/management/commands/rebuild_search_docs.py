@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from airbnb_api.cache import bump_version
+from airbnb_api.search_docs import rebuild_search_docs
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed search result card of every listing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            refreshed, removed = rebuild_search_docs(options['batch_size'])
+            # Cached responses and ETags predate the rebuilt cards
+            transaction.on_commit(bump_version)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {refreshed} search docs, removed {removed} of deleted listings'
+        ))
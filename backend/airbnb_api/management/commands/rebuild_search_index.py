@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from airbnb_api.cache import bump_version
+from airbnb_api.models import Listing
+from airbnb_api.search import index_listings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for every listing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        indexed = 0
+        batch = []
+        listings = Listing.objects.only('id', 'title', 'location', 'description').order_by('id')
+        for listing in listings.iterator(chunk_size=batch_size):
+            batch.append(listing)
+            if len(batch) >= batch_size:
+                indexed += self._index(batch)
+                batch = []
+        if batch:
+            indexed += self._index(batch)
+        # Cached text search responses and ETags predate the new index
+        bump_version()
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} listings'))
+
+    def _index(self, batch):
+        with transaction.atomic():
+            index_listings(batch)
+        return len(batch)
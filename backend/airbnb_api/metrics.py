@@ -0,0 +1,219 @@
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+# Per-request performance instrumentation. PerformanceMiddleware opens a
+# RequestStats for every request in a context variable; a wrapper installed
+# on every database connection adds each query's count and time to it (the
+# context follows the request into sync_to_async threads, so async views are
+# covered too) and timed() sections add serialization time. The totals are
+# sent back as a Server-Timing header and aggregated per view for
+# /api/metrics/. Per request this costs a few perf_counter() calls per query
+# and one lock acquisition; stacks are only walked for slow queries.
+
+logger = logging.getLogger('airbnb_api.slow_queries')
+
+# Request duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INSTRUMENTATION_FILE = os.path.abspath(__file__)
+
+_current = ContextVar('airbnb_api_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'sections', 'active')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.sections = defaultdict(float)
+        self.active = set()
+
+
+@contextmanager
+def timed(name):
+    # Adds the time spent inside to the current request's `name` section.
+    # Nested sections of the same name only count once.
+    stats = _current.get()
+    if stats is None or name in stats.active:
+        yield
+        return
+    stats.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.sections[name] += time.perf_counter() - started
+        stats.active.discard(name)
+
+
+def _record_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += duration
+        if duration * 1000 >= settings.SLOW_QUERY_MS:
+            registry.slow_query()
+            logger.warning('Slow query (%.1f ms) at %s: %s', duration * 1000, call_site(),
+                           sql if len(sql) <= 2000 else sql[:2000] + '...')
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_install_wrapper, dispatch_uid='airbnb_api.metrics')
+
+
+def call_site():
+    # Innermost frame of this project's code outside the instrumentation
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if (filename.startswith(SOURCE_ROOT) and filename != INSTRUMENTATION_FILE
+                and 'site-packages' not in filename):
+            return f'{os.path.relpath(filename, SOURCE_ROOT)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class Registry:
+    # Process-wide counters in Prometheus text format. Each worker process
+    # has its own; scrape every worker (or sum them) for the whole picture.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.counters = defaultdict(float)
+        self.histograms = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.durations = defaultdict(float)
+        self.slow_queries = 0
+
+    def observe(self, view, method, status, duration, stats, response_bytes):
+        with self.lock:
+            self.requests[(view, method, status)] += 1
+            self.durations[view] += duration
+            buckets = self.histograms[view]
+            for idx, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    buckets[idx] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            self.counters[('db_queries_total', view)] += stats.queries
+            self.counters[('db_seconds_total', view)] += stats.db_time
+            self.counters[('serialize_seconds_total', view)] += stats.sections['serialize']
+            self.counters[('response_bytes_total', view)] += response_bytes
+
+    def slow_query(self):
+        with self.lock:
+            self.slow_queries += 1
+
+    def render(self):
+        with self.lock:
+            lines = [
+                '# HELP airbnb_api_requests_total Requests served.',
+                '# TYPE airbnb_api_requests_total counter',
+            ]
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'airbnb_api_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+
+            lines += [
+                '# HELP airbnb_api_request_duration_seconds Request wall time.',
+                '# TYPE airbnb_api_request_duration_seconds histogram',
+            ]
+            for view, buckets in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, buckets):
+                    cumulative += count
+                    lines.append(f'airbnb_api_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                cumulative += buckets[-1]
+                lines.append(f'airbnb_api_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {cumulative}')
+                lines.append(f'airbnb_api_request_duration_seconds_sum{{view="{view}"}} {self.durations[view]}')
+                lines.append(f'airbnb_api_request_duration_seconds_count{{view="{view}"}} {cumulative}')
+
+            for name in ('db_queries_total', 'db_seconds_total', 'serialize_seconds_total', 'response_bytes_total'):
+                lines.append(f'# TYPE airbnb_api_{name} counter')
+                for (counter, view), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f'airbnb_api_{name}{{view="{view}"}} {value}')
+
+            lines += [
+                '# HELP airbnb_api_slow_queries_total Queries over SLOW_QUERY_MS.',
+                '# TYPE airbnb_api_slow_queries_total counter',
+                f'airbnb_api_slow_queries_total {self.slow_queries}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class PerformanceMiddleware:
+    # Works under both WSGI and ASGI without a thread switch
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started)
+
+    def finish(self, request, response, stats, started):
+        duration = time.perf_counter() - started
+        response_bytes = 0 if response.streaming else len(response.content)
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        registry.observe(view, request.method, response.status_code, duration, stats, response_bytes)
+
+        if settings.SERVER_TIMING:
+            serialize = stats.sections['serialize']
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+                f'ser;dur={serialize * 1000:.2f}',
+                f'app;dur={max(duration - stats.db_time - serialize, 0) * 1000:.2f}',
+                f'total;dur={duration * 1000:.2f}',
+            ])
+        return response
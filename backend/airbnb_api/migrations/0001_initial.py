@@ -0,0 +1,92 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Amenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Amenities',
+            },
+        ),
+        migrations.CreateModel(
+            name='Host',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('is_superhost', models.BooleanField(default=False)),
+                ('profile_image', models.URLField()),
+                ('response_rate', models.FloatField(blank=True, null=True)),
+                ('response_time', models.CharField(blank=True, max_length=50, null=True)),
+                ('join_date', models.CharField(blank=True, max_length=50, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Listing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('location', models.CharField(max_length=255)),
+                ('address', models.CharField(blank=True, max_length=255, null=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('price_per_night', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(default='USD', max_length=10)),
+                ('total_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('rating', models.FloatField()),
+                ('num_reviews', models.IntegerField(default=0)),
+                ('description', models.TextField()),
+                ('property_type', models.CharField(max_length=100)),
+                ('capacity', models.IntegerField()),
+                ('bedrooms', models.IntegerField()),
+                ('beds', models.IntegerField()),
+                ('baths', models.FloatField()),
+                ('check_in', models.CharField(blank=True, max_length=50, null=True)),
+                ('check_out', models.CharField(blank=True, max_length=50, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listings', to='airbnb_api.host')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListingImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_url', models.URLField()),
+                ('position', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='airbnb_api.listing')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ListingAmenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('amenity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='airbnb_api.amenity')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listing_amenities', to='airbnb_api.listing')),
+            ],
+            options={
+                'verbose_name_plural': 'Listing amenities',
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:29
+
+import re
+import unicodedata
+from django.db import migrations, models
+
+
+def normalize_location(value):
+    # models.normalize_location as of this migration, copied so that the
+    # backfill does not change with it
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', value.lower()))
+
+
+def fill_location_keys(apps, schema_editor):
+    # Listing.save() keeps location_key up to date from here on
+    Listing = apps.get_model('airbnb_api', 'Listing')
+    batch = []
+    for listing in Listing.objects.only('id', 'location').iterator(chunk_size=1000):
+        listing.location_key = normalize_location(listing.location)
+        batch.append(listing)
+        if len(batch) >= 1000:
+            Listing.objects.bulk_update(batch, ['location_key'])
+            batch = []
+    if batch:
+        Listing.objects.bulk_update(batch, ['location_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airbnb_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='location_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_location_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['-rating', '-id'], name='listing_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['location_key', '-rating'], name='listing_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['capacity', '-rating'], name='listing_capacity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['price_per_night', '-rating'], name='listing_price_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:29
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from django.db import migrations, models
+import django.db.models.deletion
+
+# search.py's weights and tokenizer as of this migration, copied so that
+# the backfill does not change with them
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'location': 2.0,
+    'description': 1.0,
+}
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'into', 'is', 'it',
+    'of', 'on', 'or', 'the', 'this', 'to', 'with',
+])
+
+MAX_TERM_LENGTH = 64
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [
+        word for word in re.findall(r'\w+', text.lower())
+        if 1 < len(word) <= MAX_TERM_LENGTH and word not in STOP_WORDS
+    ]
+
+
+def listing_terms(listing):
+    weights = Counter()
+    for field, field_weight in FIELD_WEIGHTS.items():
+        for term, count in Counter(tokenize(getattr(listing, field))).items():
+            weights[term] += field_weight * (1 + math.log(count))
+    return weights
+
+
+def index_listings(apps, schema_editor):
+    # Index the stored listings; the ingest path keeps new ones indexed
+    Listing = apps.get_model('airbnb_api', 'Listing')
+    SearchTerm = apps.get_model('airbnb_api', 'SearchTerm')
+    batch = []
+    listings = Listing.objects.only('id', 'title', 'location', 'description').order_by('id')
+    for listing in listings.iterator(chunk_size=1000):
+        batch.extend(
+            SearchTerm(term=term, listing_id=listing.id, weight=weight)
+            for term, weight in listing_terms(listing).items()
+        )
+        if len(batch) >= 1000:
+            SearchTerm.objects.bulk_create(batch, batch_size=1000)
+            batch = []
+    if batch:
+        SearchTerm.objects.bulk_create(batch, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airbnb_api', '0002_listing_location_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='airbnb_api.listing')),
+            ],
+            options={
+                'unique_together': {('term', 'listing')},
+            },
+        ),
+        migrations.RunPython(index_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+import hashlib
+from django.db import migrations, models
+
+
+def host_key(name, profile_image):
+    # Stored hosts have no Airbnb id, so they get ingest.host_key's name and
+    # avatar fallback; copied here so the migration does not change with it
+    raw = f"{name or ''}|{profile_image or ''}"
+    return f"name:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def fill_host_keys(apps, schema_editor):
+    # Hosts used to be created per name, so some rows share a key: the
+    # oldest one is kept and takes over the listings of the others
+    Host = apps.get_model('airbnb_api', 'Host')
+    Listing = apps.get_model('airbnb_api', 'Listing')
+    kept = {}
+    for host in Host.objects.order_by('id').iterator(chunk_size=1000):
+        key = host_key(host.name, host.profile_image)
+        if key in kept:
+            Listing.objects.filter(host_id=host.id).update(host_id=kept[key])
+            host.delete()
+        else:
+            kept[key] = host.id
+            host.host_key = key
+            host.save(update_fields=['host_key'])
+
+
+def merge_amenities(apps, schema_editor):
+    # Same for amenities created twice under one name
+    Amenity = apps.get_model('airbnb_api', 'Amenity')
+    ListingAmenity = apps.get_model('airbnb_api', 'ListingAmenity')
+    kept = {}
+    for amenity in Amenity.objects.order_by('id').iterator(chunk_size=1000):
+        if amenity.name not in kept:
+            kept[amenity.name] = amenity.id
+            continue
+        keep_id = kept[amenity.name]
+        has_kept = ListingAmenity.objects.filter(amenity_id=keep_id).values('listing_id')
+        ListingAmenity.objects.filter(amenity_id=amenity.id, listing_id__in=has_kept).delete()
+        ListingAmenity.objects.filter(amenity_id=amenity.id).update(amenity_id=keep_id)
+        amenity.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airbnb_api', '0004_listing_geohash'),
+    ]
+
+    operations = [
+        # Nullable first so existing hosts can be given their keys
+        migrations.AddField(
+            model_name='host',
+            name='host_key',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_host_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='host',
+            name='host_key',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.RunPython(merge_amenities, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='amenity',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='content_hash',
+            field=models.CharField(default='', editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
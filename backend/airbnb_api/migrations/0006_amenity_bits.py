@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airbnb_api', '0005_host_key_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='amenity',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='amenity_bits',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
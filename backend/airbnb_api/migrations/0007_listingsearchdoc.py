@@ -0,0 +1,32 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airbnb_api', '0006_amenity_bits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingSearchDoc',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('location_key', models.CharField(max_length=255)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('geohash', models.CharField(max_length=12)),
+                ('price_per_night', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('rating', models.FloatField()),
+                ('capacity', models.IntegerField()),
+                ('amenity_bits', models.BigIntegerField(default=0)),
+                ('card', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-rating', '-id'], name='search_doc_rating_idx'), models.Index(fields=['location_key', '-rating'], name='search_doc_location_idx'), models.Index(fields=['capacity', '-rating'], name='search_doc_capacity_idx'), models.Index(fields=['price_per_night', '-rating'], name='search_doc_price_idx'), models.Index(fields=['geohash'], name='search_doc_geohash_idx')],
+            },
+        ),
+    ]
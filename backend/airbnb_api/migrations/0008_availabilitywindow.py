@@ -0,0 +1,29 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airbnb_api', '0007_listingsearchdoc'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_day', models.IntegerField()),
+                ('end_day', models.IntegerField()),
+                ('run_end_day', models.IntegerField()),
+                ('nightly_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price_before', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='airbnb_api.listing')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['start_day', 'end_day', 'run_end_day'], name='availability_range_idx'), models.Index(fields=['listing', 'start_day'], name='availability_listing_idx')],
+            },
+        ),
+    ]
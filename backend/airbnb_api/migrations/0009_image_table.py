@@ -0,0 +1,112 @@
+import hashlib
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+# images.THUMBNAIL_IDS, url_hash and encode_ids as of this migration, copied
+# so that the backfill does not change with them
+THUMBNAIL_IDS = 5
+
+
+def url_hash(url):
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+def encode_ids(ids):
+    data = bytearray()
+    previous = 0
+    for value in ids:
+        delta = value - previous
+        previous = value
+        delta = delta * 2 if delta >= 0 else -delta * 2 - 1
+        while delta >= 0x80:
+            data.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return bytes(data)
+
+
+def move_image_urls(apps, schema_editor):
+    # One Image per distinct URL, linked from the ListingImage rows that
+    # held it, in id ranges so memory does not grow with the table
+    Image = apps.get_model('airbnb_api', 'Image')
+    ListingImage = apps.get_model('airbnb_api', 'ListingImage')
+    last_id = 0
+    while True:
+        batch = list(ListingImage.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'image_url')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        hashes = {url: url_hash(url) for _, url in batch}
+        Image.objects.bulk_create(
+            [Image(url_hash=digest, url=url) for url, digest in hashes.items()], ignore_conflicts=True
+        )
+        ids = dict(Image.objects.filter(url_hash__in=list(hashes.values())).values_list('url_hash', 'id'))
+        ListingImage.objects.bulk_update(
+            [ListingImage(id=row_id, image_id=ids[hashes[url]]) for row_id, url in batch], ['image']
+        )
+
+
+def fill_image_ids(apps, schema_editor):
+    # Same as the rebuild_image_ids command; search cards keep their
+    # thumbnail URLs, so they need no refresh
+    Listing = apps.get_model('airbnb_api', 'Listing')
+    ListingImage = apps.get_model('airbnb_api', 'ListingImage')
+    rows = ListingImage.objects.filter(position__lt=THUMBNAIL_IDS).order_by(
+        'listing_id', 'position', 'id'
+    ).values_list('listing_id', 'image_id')
+    batch = []
+    listing_id, image_ids = None, []
+    for row_listing_id, image_id in rows.iterator(chunk_size=BATCH_SIZE * 10):
+        if row_listing_id != listing_id:
+            if listing_id is not None:
+                batch.append(Listing(id=listing_id, image_ids=encode_ids(image_ids)))
+            listing_id, image_ids = row_listing_id, []
+        image_ids.append(image_id)
+        if len(batch) >= BATCH_SIZE:
+            Listing.objects.bulk_update(batch, ['image_ids'])
+            batch = []
+    if listing_id is not None:
+        batch.append(Listing(id=listing_id, image_ids=encode_ids(image_ids)))
+    if batch:
+        Listing.objects.bulk_update(batch, ['image_ids'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airbnb_api', '0008_availabilitywindow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Image',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_hash', models.CharField(max_length=40, unique=True)),
+                ('url', models.URLField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='image_ids',
+            field=models.BinaryField(default=b'', editable=False),
+        ),
+        # Nullable until every existing row is linked to its Image
+        migrations.AddField(
+            model_name='listingimage',
+            name='image',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='listing_images', to='airbnb_api.image'),
+        ),
+        migrations.RunPython(move_image_urls, migrations.RunPython.noop),
+        migrations.RunPython(fill_image_ids, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='listingimage',
+            name='image_url',
+        ),
+        migrations.AlterField(
+            model_name='listingimage',
+            name='image',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='listing_images', to='airbnb_api.image'),
+        ),
+    ]
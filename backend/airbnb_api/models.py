@@ -1,7 +1,19 @@
+import re
+import unicodedata
 from django.db import models
 from django.contrib.auth.models import User
+from .geo import encode_geohash
+
+def normalize_location(value):
+    # Lowercased, accent-free words separated by single spaces, so that
+    # location searches can be an indexed prefix match instead of icontains
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', value.lower()))
 
 class Host(models.Model):
+    # Airbnb host id when known, otherwise derived from name and avatar
+    host_key = models.CharField(max_length=64, unique=True)
     name = models.CharField(max_length=100)
     is_superhost = models.BooleanField(default=False)
     profile_image = models.URLField()
@@ -15,11 +27,20 @@ class Host(models.Model):
         return self.name
 
 class Listing(models.Model):
+    # Airbnb listing id; ingestion upserts on it
+    external_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    content_hash = models.CharField(max_length=40, editable=False, default='')
     title = models.CharField(max_length=255)
     location = models.CharField(max_length=255)
+    location_key = models.CharField(max_length=255, editable=False, default='')
     address = models.CharField(max_length=255, null=True, blank=True)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, editable=False, default='')
+    # OR of Amenity.bit over the listing's amenities (see amenities.py)
+    amenity_bits = models.BigIntegerField(editable=False, default=0)
+    # Ids of the first images, in order, encoded by images.encode_ids
+    image_ids = models.BinaryField(editable=False, default=b'')
     price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=10, default='USD')
     total_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -37,12 +58,36 @@ class Listing(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Match the search filters in filters.filter_listings and the
+        # default (-rating, -id) ordering of ListingViewSet
+        indexes = [
+            models.Index(fields=['-rating', '-id'], name='listing_rating_idx'),
+            models.Index(fields=['location_key', '-rating'], name='listing_location_idx'),
+            models.Index(fields=['capacity', '-rating'], name='listing_capacity_idx'),
+            models.Index(fields=['price_per_night', '-rating'], name='listing_price_idx'),
+            models.Index(fields=['geohash'], name='listing_geohash_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.location_key = normalize_location(self.location)
+        self.geohash = encode_geohash(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.title
 
+class Image(models.Model):
+    # One row per distinct image URL, shared by every listing showing it
+    url_hash = models.CharField(max_length=40, unique=True)
+    url = models.URLField()
+
+    def __str__(self):
+        return self.url
+
 class ListingImage(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='images')
-    image_url = models.URLField()
+    image = models.ForeignKey(Image, on_delete=models.PROTECT, related_name='listing_images')
     position = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -53,7 +98,9 @@ class ListingImage(models.Model):
         return f"Image for {self.listing.title}"
 
 class Amenity(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
+    # Position in Listing.amenity_bits; only the first 63 amenities get one
+    bit = models.PositiveSmallIntegerField(null=True, blank=True, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -71,4 +118,69 @@ class ListingAmenity(models.Model):
         verbose_name_plural = 'Listing amenities'
 
     def __str__(self):
-        return f"{self.amenity.name} for {self.listing.title}"
\ No newline at end of file
+        return f"{self.amenity.name} for {self.listing.title}"
+
+class SearchTerm(models.Model):
+    # Inverted index over listing title, location and description, kept up
+    # to date by the ingest path (see search.py)
+    term = models.CharField(max_length=64)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.FloatField()
+
+    class Meta:
+        unique_together = ('term', 'listing')
+
+    def __str__(self):
+        return f"{self.term} for {self.listing.title}"
+
+class AvailabilityWindow(models.Model):
+    # Nights [start_day, end_day) a listing is free at nightly_price, as day
+    # numbers since 1970-01-01 (see availability.py). run_end_day is the end
+    # of the unbroken run of free nights the window belongs to, and
+    # price_before the price of the run's nights before this window, so that
+    # any stay inside a run is found and priced from two windows.
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='availability')
+    start_day = models.IntegerField()
+    end_day = models.IntegerField()
+    run_end_day = models.IntegerField()
+    nightly_price = models.DecimalField(max_digits=10, decimal_places=2)
+    price_before = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_day', 'end_day', 'run_end_day'], name='availability_range_idx'),
+            models.Index(fields=['listing', 'start_day'], name='availability_listing_idx'),
+        ]
+
+    def __str__(self):
+        return f"Availability for {self.listing_id} from day {self.start_day} to {self.end_day}"
+
+class ListingSearchDoc(models.Model):
+    # Denormalized search result card for each listing (see search_docs.py).
+    # id is the listing's id, and the filter columns share Listing's names so
+    # that filters.filter_listings applies to this table unchanged.
+    id = models.BigIntegerField(primary_key=True)
+    location_key = models.CharField(max_length=255)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12)
+    price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
+    rating = models.FloatField()
+    capacity = models.IntegerField()
+    amenity_bits = models.BigIntegerField(default=0)
+    # JSON text rather than a JSONField, which MySQL would store with its
+    # keys reordered
+    card = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-rating', '-id'], name='search_doc_rating_idx'),
+            models.Index(fields=['location_key', '-rating'], name='search_doc_location_idx'),
+            models.Index(fields=['capacity', '-rating'], name='search_doc_capacity_idx'),
+            models.Index(fields=['price_per_night', '-rating'], name='search_doc_price_idx'),
+            models.Index(fields=['geohash'], name='search_doc_geohash_idx'),
+        ]
+
+    def __str__(self):
+        return f"Search card for listing {self.id}"
@@ -0,0 +1,101 @@
+import base64
+import json
+import math
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Ordering the keyset cursor is built on, backed by listing_rating_idx
+KEYSET_ORDERING = ('-rating', '-id')
+
+
+def keyset_filter(queryset, rating, pk):
+    # Rows strictly after (rating, pk) in KEYSET_ORDERING
+    return queryset.filter(Q(rating__lt=rating) | Q(rating=rating, id__lt=pk))
+
+
+def encode_cursor(rating, pk):
+    return base64.urlsafe_b64encode(json.dumps([rating, pk]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        rating, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        rating, pk = float(rating), int(pk)
+    except (TypeError, ValueError):
+        raise NotFound('Invalid cursor')
+    # json.loads accepts NaN and Infinity, which no stored rating compares to
+    if not math.isfinite(rating):
+        raise NotFound('Invalid cursor')
+    return rating, pk
+
+
+def _field(item, name):
+    return item[name] if isinstance(item, dict) else getattr(item, name)
+
+
+class ListingPagination(BasePagination):
+    # Keyset pagination on (rating, id) by default: every page is an index
+    # range scan no matter how deep, and rows inserted while paging are
+    # neither skipped nor repeated. Passing ?page= keeps the page-number
+    # behaviour, which is also used when a search reorders the results
+    # (relevance or distance).
+    page_size = 20
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def __init__(self):
+        self.page_number_pagination = PageNumberPagination()
+        self.page_number_pagination.page_size_query_param = self.page_size_query_param
+        self.page_number_pagination.max_page_size = self.max_page_size
+        self.use_page_numbers = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_page_numbers = (
+            self.page_number_pagination.page_query_param in request.query_params
+            or tuple(queryset.query.order_by) != KEYSET_ORDERING
+        )
+        if self.use_page_numbers:
+            return self.page_number_pagination.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = keyset_filter(queryset, *decode_cursor(cursor))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   encode_cursor(_field(last, 'rating'), _field(last, 'id')))
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        if self.use_page_numbers:
+            return self.page_number_pagination.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
@@ -0,0 +1,68 @@
+import math
+from collections import Counter
+from django.db.models import Count, Sum
+from .models import normalize_location, SearchTerm
+
+# How much a term occurrence counts depending on the field it appears in
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'location': 2.0,
+    'description': 1.0,
+}
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'into', 'is', 'it',
+    'of', 'on', 'or', 'the', 'this', 'to', 'with',
+])
+
+MAX_TERM_LENGTH = 64
+
+# Listings per delete, to stay under the backends' parameter limits
+BATCH_SIZE = 500
+
+
+def tokenize(text):
+    # Same normalization as location keys: lowercase, accent-free words
+    return [
+        word for word in normalize_location(text).split()
+        if 1 < len(word) <= MAX_TERM_LENGTH and word not in STOP_WORDS
+    ]
+
+
+def listing_terms(listing):
+    # Term -> weight for one listing. Repeated occurrences are dampened
+    # logarithmically so long descriptions do not drown out titles.
+    weights = Counter()
+    for field, field_weight in FIELD_WEIGHTS.items():
+        for term, count in Counter(tokenize(getattr(listing, field))).items():
+            weights[term] += field_weight * (1 + math.log(count))
+    return weights
+
+
+def index_listings(listings):
+    # Replace the index entries of the given (saved) listings
+    listings = [listing for listing in listings if listing.pk is not None]
+    if not listings:
+        return
+
+    for start in range(0, len(listings), BATCH_SIZE):
+        SearchTerm.objects.filter(listing__in=listings[start:start + BATCH_SIZE]).delete()
+    SearchTerm.objects.bulk_create([
+        SearchTerm(term=term, listing=listing, weight=weight)
+        for listing in listings
+        for term, weight in listing_terms(listing).items()
+    ], batch_size=1000)
+
+
+def search_listings(queryset, query):
+    # Listings containing every query term, ranked by summed term weight.
+    # Each term is an index lookup on (term, listing), so the cost follows
+    # the number of matching postings rather than the size of the table.
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return queryset.none()
+
+    return queryset.filter(search_terms__term__in=terms).annotate(
+        matched_terms=Count('search_terms'),
+        relevance=Sum('search_terms__weight'),
+    ).filter(matched_terms=len(terms)).order_by('-relevance', '-rating', '-id')
@@ -0,0 +1,89 @@
+import json
+from decimal import Decimal
+from django.db import connection
+from .availability import CENT
+from .models import Listing, ListingSearchDoc
+
+# Filter columns copied from Listing into ListingSearchDoc
+DOC_COLUMNS = ['location_key', 'latitude', 'longitude', 'geohash', 'price_per_night',
+               'rating', 'capacity', 'amenity_bits']
+
+DOC_UPDATE_FIELDS = DOC_COLUMNS + ['card', 'updated_at']
+
+# Request parameters the search docs cannot answer: full-text search needs
+# the term index, and other field selections need the full listing
+UNSUPPORTED_PARAMS = ('q', 'fields', 'expand')
+
+# Listings per refresh query, under the backends' parameter limits (999 on
+# older SQLite builds)
+BATCH_SIZE = 500
+
+
+def card_serializer():
+    # Imported here: serializers imports ingest, which refreshes search docs
+    from .fastpath import FastListingSerializer
+    from .serializers import ListingCardSerializer, selected_fields
+    fields = selected_fields(ListingCardSerializer, {})
+    return fields, FastListingSerializer(ListingCardSerializer(context={'fields': fields}))
+
+
+def load_cards(rows):
+    # Stored cards have stay_total set to None; date searches fill it in
+    # from the row's annotation
+    cards = []
+    for row in rows:
+        card = json.loads(row['card'])
+        if row.get('stay_total') is not None:
+            card['stay_total'] = f"{Decimal(row['stay_total']).quantize(CENT):f}"
+        cards.append(card)
+    return cards
+
+
+def can_serve(params):
+    return not any(params.get(name) for name in UNSUPPORTED_PARAMS)
+
+
+def refresh_search_docs(listing_ids):
+    # Rebuild the cards of the given listings: two queries to build them
+    # (the same ones as the fast path) and one upsert per batch. Docs of
+    # listings that no longer exist are removed.
+    from .serializers import listing_queryset
+    listing_ids = list(listing_ids)
+    fields, fast_serializer = card_serializer()
+    refreshed = 0
+    for start in range(0, len(listing_ids), BATCH_SIZE):
+        batch_ids = listing_ids[start:start + BATCH_SIZE]
+        rows = list(fast_serializer.values(listing_queryset(fields).filter(id__in=batch_ids), DOC_COLUMNS))
+        cards = fast_serializer.serialize(rows)
+
+        docs = [
+            ListingSearchDoc(id=row['id'], card=json.dumps(card, separators=(',', ':')),
+                             **{name: row[name] for name in DOC_COLUMNS})
+            for row, card in zip(rows, cards)
+        ]
+        options = {'update_conflicts': True, 'update_fields': DOC_UPDATE_FIELDS}
+        if connection.features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['id']
+        ListingSearchDoc.objects.bulk_create(docs, **options)
+
+        found = {row['id'] for row in rows}
+        missing = [pk for pk in batch_ids if pk not in found]
+        if missing:
+            ListingSearchDoc.objects.filter(id__in=missing).delete()
+        refreshed += len(docs)
+    return refreshed
+
+
+def rebuild_search_docs(batch_size=BATCH_SIZE):
+    # Every listing's card, then drop docs of deleted listings
+    refreshed = 0
+    batch = []
+    for listing_id in Listing.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size):
+        batch.append(listing_id)
+        if len(batch) >= batch_size:
+            refreshed += refresh_search_docs(batch)
+            batch = []
+    if batch:
+        refreshed += refresh_search_docs(batch)
+    removed, _ = ListingSearchDoc.objects.exclude(id__in=Listing.objects.values('id')).delete()
+    return refreshed, removed
@@ -0,0 +1,70 @@
+import re
+from django.db import connection
+from django.http import QueryDict
+from .filters import filter_listings
+from .models import Listing
+
+# Representative ListingViewSet searches and the indexed columns they filter
+SEARCHES = [
+    ('location=new york', ('location_key',)),
+    ('guests=4', ('capacity',)),
+    ('minPrice=100&maxPrice=250', ('price_per_night',)),
+    ('minRating=4.5', ('rating',)),
+    ('location=miami&guests=2&minPrice=50&maxPrice=400&minRating=4',
+     ('location_key', 'capacity', 'price_per_night', 'rating')),
+    ('near=40.71,-74.0&radius_km=5', ('geohash',)),
+    ('bbox=-74.1,40.6,-73.9,40.8', ('geohash',)),
+]
+
+# Plans that read a whole table or walk a whole index
+FULL_SCAN_PATTERNS = {
+    'mysql': r'"access_type":\s*"(ALL|index)"',
+    'sqlite': r'\bSCAN\b',
+    'postgresql': r'Seq Scan',
+}
+
+SORT_PATTERNS = {
+    'mysql': r'"using_filesort":\s*true',
+    'sqlite': r'USE TEMP B-TREE FOR ORDER BY',
+    'postgresql': r'\bSort\b',
+}
+
+FULL_SCAN = 'FULL SCAN'
+SORT = 'SORT'
+OK = 'OK'
+
+
+def supported():
+    return connection.vendor in FULL_SCAN_PATTERNS
+
+
+def explain_search(search):
+    queryset = filter_listings(Listing.objects.order_by('-rating', '-id'), QueryDict(search))
+    return queryset[:20].explain(**({'format': 'json'} if connection.vendor == 'mysql' else {}))
+
+
+def plan_status(plan, columns):
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        # A SCAN is only acceptable next to a SEARCH on one of the filtered
+        # columns (e.g. the scan of a subquery's small result)
+        searched = any(
+            re.search(r'\bSEARCH\b', line) and any(column in line for column in columns)
+            for line in plan.splitlines()
+        )
+        if re.search(FULL_SCAN_PATTERNS[vendor], plan) and not searched:
+            return FULL_SCAN
+    elif re.search(FULL_SCAN_PATTERNS[vendor], plan, re.MULTILINE):
+        return FULL_SCAN
+    if re.search(SORT_PATTERNS[vendor], plan, re.MULTILINE):
+        return SORT
+    return OK
+
+
+def check_search_plans():
+    # (search, status, plan) for every search in SEARCHES
+    results = []
+    for search, columns in SEARCHES:
+        plan = explain_search(search)
+        results.append((search, plan_status(plan, columns), plan))
+    return results
@@ -1,5 +1,52 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Host, Listing, ListingImage, Amenity, ListingAmenity
+from .models import Host, Listing, ListingImage, Amenity
+from .ingest import ingest_listings
+from .metrics import timed
+
+# Serializer fields that are not Listing columns, and how to load them
+RELATED_FIELDS = ('host', 'images', 'amenities', 'thumbnail', 'stay_total')
+
+def _split_param(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+def selected_fields(serializer_class, params):
+    # Fields to render: ?fields= replaces the serializer's defaults and
+    # ?expand= adds to them. Unknown names are ignored.
+    available = serializer_class.Meta.fields
+    requested = _split_param(params.get('fields')) or set(
+        getattr(serializer_class, 'default_fields', available)
+    )
+    requested |= _split_param(params.get('expand'))
+    return [name for name in available if name in requested]
+
+def listing_queryset(fields):
+    # Load only the columns and relations the selected fields need. id and
+    # rating are always loaded as the default ordering and cursor use them.
+    columns = {'id', 'rating'} | {name for name in fields if name not in RELATED_FIELDS}
+    queryset = Listing.objects.all()
+    if 'host' in fields:
+        columns.add('host')
+        queryset = queryset.select_related('host')
+    if 'images' in fields:
+        queryset = queryset.prefetch_related(Prefetch('images', queryset=ListingImage.objects.select_related('image')))
+    if 'thumbnail' in fields:
+        queryset = queryset.prefetch_related(Prefetch(
+            'images', queryset=ListingImage.objects.filter(position=0).select_related('image'),
+            to_attr='thumbnail_images'
+        ))
+    if 'amenities' in fields:
+        queryset = queryset.prefetch_related('listing_amenities__amenity')
+    return queryset.only(*columns).order_by('-rating', '-id')
+
+class DynamicFieldsMixin:
+    # Drops every field not listed in the 'fields' serializer context entry
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 class HostSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,6 +55,8 @@ class HostSerializer(serializers.ModelSerializer):
                  'response_time', 'join_date']
 
 class ListingImageSerializer(serializers.ModelSerializer):
+    image_url = serializers.URLField(source='image.url', read_only=True)
+
     class Meta:
         model = ListingImage
         fields = ['id', 'image_url', 'position']
@@ -17,7 +66,7 @@ class AmenitySerializer(serializers.ModelSerializer):
         model = Amenity
         fields = ['id', 'name']
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     host = HostSerializer(read_only=True)
     images = serializers.SerializerMethodField()
     amenities = serializers.SerializerMethodField()
@@ -30,58 +79,68 @@ class ListingSerializer(serializers.ModelSerializer):
                  'bedrooms', 'beds', 'baths', 'check_in', 'check_out',
                  'host', 'images', 'amenities']
 
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+    # Both read through the related managers so that the prefetch done in
+    # ListingViewSet.get_queryset is reused instead of querying per listing
     def get_images(self, obj):
-        images = ListingImage.objects.filter(listing=obj)
-        return [image.image_url for image in images]
+        return [image.image.url for image in obj.images.all()]
 
     def get_amenities(self, obj):
-        listing_amenities = ListingAmenity.objects.filter(listing=obj)
-        return [la.amenity.name for la in listing_amenities]
+        return [la.amenity.name for la in obj.listing_amenities.all()]
+
+class ListingCardSerializer(ListingSerializer):
+    # Search result card: renders default_fields unless the request asks for
+    # more with ?expand= or for something else with ?fields=
+    thumbnail = serializers.SerializerMethodField()
+    # Price of the whole stay when the search has checkIn/checkOut dates,
+    # computed by the query (see availability.filter_available)
+    stay_total = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True, default=None)
+    default_fields = ['id', 'title', 'location', 'latitude', 'longitude', 'price_per_night',
+                      'currency', 'rating', 'num_reviews', 'property_type', 'capacity',
+                      'thumbnail', 'stay_total']
+
+    class Meta(ListingSerializer.Meta):
+        fields = ListingSerializer.Meta.fields + ['thumbnail', 'stay_total']
+
+    def get_thumbnail(self, obj):
+        images = getattr(obj, 'thumbnail_images', None)
+        if images is None:
+            images = obj.images.all()[:1]
+        return images[0].image.url if images else None
+
+class AvailabilityWindowSerializer(serializers.Serializer):
+    # Nights from start up to (not including) end; nightly_price defaults to
+    # the listing's price_per_night
+    start = serializers.DateField()
+    end = serializers.DateField()
+    nightly_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+
+    def validate(self, data):
+        if data['end'] <= data['start']:
+            raise serializers.ValidationError('end must be after start')
+        return data
 
 class ListingCreateSerializer(serializers.ModelSerializer):
+    # Declared explicitly so that re-posting a known listing is an upsert
+    # rather than a unique validation error
+    external_id = serializers.CharField(max_length=64, required=False, allow_null=True)
     host_data = serializers.JSONField(write_only=True)
     images = serializers.ListField(child=serializers.URLField(), write_only=True)
     amenities = serializers.ListField(child=serializers.CharField(), write_only=True)
+    # The listing's full calendar: replaces the stored windows when given
+    availability = AvailabilityWindowSerializer(many=True, required=False, write_only=True)
     
     class Meta:
         model = Listing
-        fields = ['title', 'location', 'address', 'latitude', 'longitude',
+        fields = ['external_id', 'title', 'location', 'address', 'latitude', 'longitude',
                  'price_per_night', 'currency', 'total_price', 'rating',
                  'num_reviews', 'description', 'property_type', 'capacity',
                  'bedrooms', 'beds', 'baths', 'check_in', 'check_out',
-                 'host_data', 'images', 'amenities']
+                 'host_data', 'images', 'amenities', 'availability']
 
     def create(self, validated_data):
-        host_data = validated_data.pop('host_data')
-        images_data = validated_data.pop('images')
-        amenities_data = validated_data.pop('amenities')
-        
-        # Create or get host
-        host, created = Host.objects.get_or_create(
-            name=host_data.get('name'),
-            defaults={
-                'is_superhost': host_data.get('isSuperhost', False),
-                'profile_image': host_data.get('profileImage', ''),
-                'response_rate': host_data.get('responseRate'),
-                'response_time': host_data.get('responseTime'),
-                'join_date': host_data.get('joinDate')
-            }
-        )
-        
-        # Create listing
-        listing = Listing.objects.create(host=host, **validated_data)
-        
-        # Add images
-        for idx, image_url in enumerate(images_data):
-            ListingImage.objects.create(
-                listing=listing,
-                image_url=image_url,
-                position=idx
-            )
-        
-        # Add amenities
-        for amenity_name in amenities_data:
-            amenity, created = Amenity.objects.get_or_create(name=amenity_name)
-            ListingAmenity.objects.create(listing=listing, amenity=amenity)
-        
-        return listing
\ No newline at end of file
+        listing, _ = ingest_listings([validated_data])[0]
+        return listing
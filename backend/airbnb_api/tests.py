@@ -0,0 +1,492 @@
+import base64
+import datetime
+import sqlite3
+from io import StringIO
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from .amenities import assign_bits
+from .cache import current_version
+from .fastpath import FastListingSerializer
+from .images import decode_ids, encode_ids
+from .metrics import registry
+from .ingest import ingest_listings
+from .models import Amenity, Host, Image, Listing, ListingAmenity, ListingImage, ListingSearchDoc
+from .benchmarks import grow_listings
+from .renderers import FastJSONRenderer
+from .search_plans import FULL_SCAN, check_search_plans, supported
+from .search_docs import load_cards
+from .serializers import (ListingCreateSerializer, ListingSerializer, ListingCardSerializer,
+                          listing_queryset, selected_fields)
+
+# Run with: DB_ENGINE=sqlite python -m django test airbnb_api.tests --settings=django_backend.settings
+
+
+def listing_payload(idx, **overrides):
+    payload = {
+        'external_id': f'test-{idx}',
+        'title': f'Test listing {idx}',
+        'location': 'New York',
+        'address': f'{idx} Main Street',
+        'latitude': 40.7 + idx / 1000,
+        'longitude': -74.0 + idx / 1000,
+        'price_per_night': '120.50',
+        'currency': 'USD',
+        'total_price': None,
+        'rating': 4.5 + idx / 100,
+        'num_reviews': idx,
+        'description': 'A quiet apartment near the park',
+        'property_type': 'Apartment',
+        'capacity': 4,
+        'bedrooms': 2,
+        'beds': 2,
+        'baths': 1.5,
+        'check_in': None,
+        'check_out': None,
+        'host_data': {'id': idx % 2, 'name': f'Host {idx % 2}', 'isSuperhost': True},
+        'images': [f'https://a0.muscache.com/im/pictures/{idx}-{n}.jpg' for n in range(3)],
+        'amenities': ['Wifi', 'Kitchen'] if idx % 2 else ['Wifi', 'Pool'],
+    }
+    payload.update(overrides)
+    return payload
+
+
+def create_listings(count, start=0):
+    validated = []
+    for idx in range(start, start + count):
+        serializer = ListingCreateSerializer(data=listing_payload(idx))
+        serializer.is_valid(raise_exception=True)
+        validated.append(serializer.validated_data)
+    return [listing for listing, _ in ingest_listings(validated)]
+
+
+class ListingQueryCountTests(TestCase):
+    # The listing endpoints load related rows per page, not per listing:
+    # the query count with many listings is the same as with one
+
+    def get(self, path):
+        # Cached responses would skip the database altogether
+        caches['listings'].clear()
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertConstantQueries(self, path):
+        create_listings(1)
+        with CaptureQueriesContext(connection) as single:
+            self.get(path)
+        create_listings(19, start=1)
+        with self.assertNumQueries(len(single.captured_queries)):
+            response = self.get(path)
+        return response
+
+    def test_list(self):
+        response = self.assertConstantQueries('/api/listings/')
+        self.assertEqual(len(response.json()['results']), 20)
+
+    def test_list_expanded(self):
+        response = self.assertConstantQueries('/api/listings/?expand=host,images,amenities')
+        self.assertEqual(len(response.json()['results'][0]['images']), 3)
+
+    def test_list_page_numbers(self):
+        self.assertConstantQueries('/api/listings/?page=1&location=new')
+
+    @override_settings(LISTINGS_FAST_PATH=True)
+    def test_fast_path_list(self):
+        self.assertConstantQueries('/api/listings/?expand=host,images,amenities')
+
+    def test_retrieve(self):
+        listing = create_listings(5)[-1]
+        # Listing with host, then images, listing amenities and amenities
+        with self.assertNumQueries(4):
+            self.get(f'/api/listings/{listing.pk}/')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        caches['listings'].clear()
+        # Runs of equal ratings, so that pages break inside ties
+        for idx in range(23):
+            serializer = ListingCreateSerializer(data=listing_payload(idx, rating=4.0 + idx % 3 / 2))
+            serializer.is_valid(raise_exception=True)
+            ingest_listings([serializer.validated_data])
+
+    def test_pages_through_ties_without_gaps_or_repeats(self):
+        expected = list(Listing.objects.order_by('-rating', '-id').values_list('id', flat=True))
+        seen = []
+        url = '/api/listings/?page_size=4'
+        while url:
+            body = self.client.get(url).json()
+            self.assertLessEqual(len(body['results']), 4)
+            seen += [listing['id'] for listing in body['results']]
+            url = body['next']
+        self.assertEqual(seen, expected)
+
+    def test_tampered_cursor_is_not_found(self):
+        cursors = ['not-a-cursor', '[4.5]', '{"rating": 4.5, "id": 3}', '"ab"', '[null, 3]', '[NaN, 3]', '[4.5, "x"]']
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                if cursor != 'not-a-cursor':
+                    cursor = base64.urlsafe_b64encode(cursor.encode()).decode()
+                response = self.client.get(f'/api/listings/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
+
+
+class FastPathTests(TestCase):
+    def setUp(self):
+        create_listings(3)
+
+    def test_matches_drf_serializers(self):
+        renderer = FastJSONRenderer()
+        for serializer_class in (ListingSerializer, ListingCardSerializer):
+            fields = selected_fields(serializer_class, {})
+            context = {'fields': fields}
+            drf = serializer_class(list(listing_queryset(fields)), many=True, context=context).data
+            fast_serializer = FastListingSerializer(serializer_class(context=context))
+            fast = fast_serializer.serialize(fast_serializer.values(listing_queryset(fields)))
+            self.assertEqual(len(fast), 3)
+            self.assertEqual(renderer.render(fast), renderer.render(drf))
+
+
+class SearchDocTests(TestCase):
+    def test_ingest_refreshes_search_docs(self):
+        listings = create_listings(3)
+        fields = selected_fields(ListingCardSerializer, {})
+        context = {'fields': fields}
+        expected = ListingCardSerializer(list(listing_queryset(fields)), many=True, context=context).data
+        docs = ListingSearchDoc.objects.order_by('-rating', '-id').values('card')
+        renderer = FastJSONRenderer()
+        self.assertEqual(renderer.render(load_cards(docs)), renderer.render(expected))
+
+        # Re-ingesting a changed listing rewrites its card
+        serializer = ListingCreateSerializer(data=listing_payload(0, title='Renamed listing'))
+        serializer.is_valid(raise_exception=True)
+        ingest_listings([serializer.validated_data])
+        card = load_cards(ListingSearchDoc.objects.filter(id=listings[0].pk).values('card'))[0]
+        self.assertEqual(card['title'], 'Renamed listing')
+
+    def test_add_listing_writes_search_doc(self):
+        response = self.client.post('/api/add_listing/', listing_payload(7), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        card = load_cards(ListingSearchDoc.objects.filter(id=response.json()['id']).values('card'))[0]
+        self.assertEqual(card['title'], 'Test listing 7')
+        self.assertEqual(card['thumbnail'], 'https://a0.muscache.com/im/pictures/7-0.jpg')
+
+
+class IngestUpsertTests(TestCase):
+    def ingest(self, *payloads):
+        validated = []
+        for payload in payloads:
+            serializer = ListingCreateSerializer(data=payload)
+            serializer.is_valid(raise_exception=True)
+            validated.append(serializer.validated_data)
+        return ingest_listings(validated)
+
+    def test_reposting_the_same_payload_writes_nothing(self):
+        self.ingest(listing_payload(1), listing_payload(2))
+        with CaptureQueriesContext(connection) as queries:
+            results = self.ingest(listing_payload(1), listing_payload(2))
+        self.assertEqual([status for _, status in results], ['unchanged', 'unchanged'])
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+
+    def test_changed_images_and_amenities_replace_the_links(self):
+        listing, _ = self.ingest(listing_payload(1))[0]
+        images = ['https://a0.muscache.com/im/pictures/1-2.jpg', 'https://a0.muscache.com/im/pictures/new.jpg']
+        (updated, status), = self.ingest(listing_payload(1, images=images, amenities=['Wifi', 'Sauna']))
+        self.assertEqual((updated.pk, status), (listing.pk, 'updated'))
+        self.assertEqual(list(ListingImage.objects.filter(listing=listing).order_by('position').values_list(
+            'image__url', flat=True)), images)
+        self.assertEqual(set(ListingAmenity.objects.filter(listing=listing).values_list(
+            'amenity__name', flat=True)), {'Wifi', 'Sauna'})
+
+    def test_listings_of_one_host_share_its_row(self):
+        host_data = {'id': 7, 'name': 'Ana', 'isSuperhost': False}
+        self.ingest(listing_payload(1, host_data=host_data), listing_payload(2, host_data=host_data))
+        self.assertEqual(Host.objects.count(), 1)
+        # A changed host is updated in place
+        self.ingest(listing_payload(3, host_data=dict(host_data, name='Ana B', isSuperhost=True)))
+        host = Host.objects.get()
+        self.assertEqual((host.name, host.is_superhost, host.listings.count()), ('Ana B', True, 3))
+
+
+class ImageTests(TestCase):
+    def test_encoded_ids_round_trip(self):
+        for ids in ([], [1], [5, 6, 7], [900, 12, 11, 3], [2 ** 63 - 1, 1, 2 ** 40, 2 ** 40 + 1], [7, 7, 0]):
+            with self.subTest(ids=ids):
+                self.assertEqual(decode_ids(encode_ids(ids)), ids)
+        # Neighbouring ids take one byte each after the first
+        self.assertEqual(len(encode_ids([100000, 100001, 100002])), 3 + 2)
+
+    def test_listings_sharing_a_url_share_its_image(self):
+        shared = 'https://a0.muscache.com/im/pictures/shared.jpg'
+        create_listings(1)
+        serializer = ListingCreateSerializer(data=listing_payload(1, images=[shared, listing_payload(0)['images'][0]]))
+        serializer.is_valid(raise_exception=True)
+        ingest_listings([serializer.validated_data])
+        serializer = ListingCreateSerializer(data=listing_payload(2, images=[shared]))
+        serializer.is_valid(raise_exception=True)
+        ingest_listings([serializer.validated_data])
+        self.assertEqual(Image.objects.filter(url=shared).count(), 1)
+        self.assertEqual(Image.objects.count(), 4)
+        image = Image.objects.get(url=shared)
+        self.assertEqual(image.listing_images.count(), 2)
+        listing = Listing.objects.get(external_id='test-2')
+        self.assertEqual(decode_ids(listing.image_ids), [image.pk])
+
+
+class AvailabilityTests(TestCase):
+    # One listing free for nights +10..+13 at 100 and +13..+16 at 150 (a
+    # single run of two windows), then again +20..+25 at 80 after a gap
+
+    def setUp(self):
+        today = datetime.date.today()
+        self.day = lambda offset: (today + datetime.timedelta(days=offset)).isoformat()
+        availability = [
+            {'start': self.day(10), 'end': self.day(13), 'nightly_price': '100.00'},
+            {'start': self.day(13), 'end': self.day(16), 'nightly_price': '150.00'},
+            {'start': self.day(20), 'end': self.day(25), 'nightly_price': '80.00'},
+        ]
+        serializer = ListingCreateSerializer(data=listing_payload(0, availability=availability))
+        serializer.is_valid(raise_exception=True)
+        ingest_listings([serializer.validated_data])
+
+    def stay_totals(self, check_in, check_out):
+        caches['listings'].clear()
+        response = self.client.get(f'/api/listings/?checkIn={self.day(check_in)}&checkOut={self.day(check_out)}')
+        self.assertEqual(response.status_code, 200)
+        return [listing['stay_total'] for listing in response.json()['results']]
+
+    def test_stay_inside_one_window(self):
+        self.assertEqual(self.stay_totals(10, 12), ['200.00'])
+        self.assertEqual(self.stay_totals(21, 22), ['80.00'])
+
+    def test_stay_across_two_windows(self):
+        # Nights +11 and +12 at 100, +13 and +14 at 150
+        self.assertEqual(self.stay_totals(11, 15), ['500.00'])
+
+    def test_stay_ending_on_a_boundary(self):
+        # Check-out is the night the next window or the run starts, so it is
+        # not paid for
+        self.assertEqual(self.stay_totals(10, 13), ['300.00'])
+        self.assertEqual(self.stay_totals(14, 16), ['300.00'])
+        self.assertEqual(self.stay_totals(20, 25), ['400.00'])
+
+    def test_unavailable_nights_exclude_the_listing(self):
+        self.assertEqual(self.stay_totals(15, 21), [])
+        self.assertEqual(self.stay_totals(14, 17), [])
+        self.assertEqual(self.stay_totals(9, 11), [])
+        self.assertEqual(self.stay_totals(24, 26), [])
+
+
+class BulkIngestTests(TestCase):
+    def test_repeated_external_id_is_stored_once(self):
+        batch = [listing_payload(1, title='First'), listing_payload(2), listing_payload(1, title='Last')]
+        response = self.client.post('/api/add_listings_bulk/', batch, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['created'], body['duplicates']), (2, 1))
+        self.assertEqual(body['results'][0]['status'], 'duplicate')
+        self.assertEqual(body['results'][0]['id'], body['results'][2]['id'])
+        self.assertEqual(Listing.objects.get(external_id='test-1').title, 'Last')
+
+    def test_large_batch_stays_under_parameter_limit(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Lowers an SQLite limit')
+        items = []
+        for idx in range(1200):
+            serializer = ListingCreateSerializer(data=listing_payload(idx, host_data={'id': idx, 'name': 'Host'}))
+            serializer.is_valid(raise_exception=True)
+            items.append(serializer.validated_data)
+        connection.ensure_connection()
+        limit = connection.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        try:
+            ingest_listings(items)
+            # Re-ingesting reads every listing back by external_id
+            statuses = {status for _, status in ingest_listings(items)}
+        finally:
+            connection.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit)
+        self.assertEqual(statuses, {'unchanged'})
+        self.assertEqual(Listing.objects.count(), 1200)
+
+
+class RebuildCommandTests(TestCase):
+    def test_rebuilds_invalidate_cached_responses(self):
+        create_listings(2)
+        for command in ('rebuild_search_docs', 'rebuild_amenity_bits', 'rebuild_image_ids', 'rebuild_search_index'):
+            with self.subTest(command=command):
+                version = current_version()
+                with self.captureOnCommitCallbacks(execute=True):
+                    call_command(command, stdout=StringIO())
+                self.assertNotEqual(current_version(), version)
+
+
+class AmenityBitTests(TestCase):
+    def test_stale_amenity_keeps_its_stored_bit(self):
+        # An ingest racing another one for a new amenity gets an unsaved
+        # object without the bit the other one stored and used
+        create_listings(1)
+        pool = Amenity.objects.get(name='Pool')
+        stale = Amenity(pk=pool.pk, name='Pool')
+        assign_bits([stale])
+        self.assertEqual(stale.bit, pool.bit)
+        self.assertEqual(Amenity.objects.get(pk=pool.pk).bit, pool.bit)
+        response = self.client.get('/api/listings/?amenities=Pool')
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class SearchPlanTests(TestCase):
+    # Planners prefer full scans on near-empty tables, so the searches are
+    # explained over a few thousand listings with fresh statistics
+
+    @classmethod
+    def setUpTestData(cls):
+        grow_listings(3000)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def test_searches_use_indexes(self):
+        if not supported():
+            self.skipTest(f'No plan checks for {connection.vendor}')
+        for search, status, plan in check_search_plans():
+            with self.subTest(search=search):
+                self.assertNotEqual(status, FULL_SCAN, plan)
+
+
+class MapSearchTests(TestCase):
+    def test_invalid_radius_and_coordinates_are_ignored(self):
+        create_listings(3)
+        for query in ('near=40.7,-74.0&radius_km=nan', 'near=40.7,-74.0&radius_km=inf',
+                      'near=40.7,-74.0&radius_km=-5', 'near=nan,-74.0', 'near=40.7,inf',
+                      'bbox=-74.1,nan,-73.9,40.8', 'bbox=-inf,40.6,inf,40.8'):
+            with self.subTest(query=query):
+                caches['listings'].clear()
+                response = self.client.get(f'/api/listings/?{query}')
+                self.assertEqual(response.status_code, 200)
+        # A bad radius searches the default one
+        response = self.client.get('/api/listings/?near=40.7,-74.0&radius_km=nan')
+        self.assertEqual(len(response.json()['results']), 3)
+
+
+class FacetTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        caches['listings'].clear()
+        fixture = [
+            ('100.00', 4.8, 'Apartment', ['Wifi', 'Pool']),
+            ('150.00', 4.2, 'House', ['Wifi', 'Kitchen']),
+            ('200.00', 3.6, 'Apartment', ['Wifi', 'Pool']),
+            ('300.00', 3.0, 'Apartment', ['Wifi', 'Kitchen']),
+        ]
+        validated = []
+        for idx, (price, rating, property_type, amenities) in enumerate(fixture):
+            serializer = ListingCreateSerializer(data=listing_payload(
+                idx, price_per_night=price, rating=rating, property_type=property_type, amenities=amenities))
+            serializer.is_valid(raise_exception=True)
+            validated.append(serializer.validated_data)
+        ingest_listings(validated)
+
+    def test_counts_and_price_histogram(self):
+        body = self.client.get('/api/listings/facets/?bins=2').json()
+        self.assertEqual(body['count'], 4)
+        self.assertEqual(body['rating'], [
+            {'min': 4.5, 'count': 1}, {'min': 4.0, 'count': 2}, {'min': 3.5, 'count': 3}, {'min': 3.0, 'count': 4},
+        ])
+        self.assertEqual(body['property_types'], [
+            {'value': 'Apartment', 'count': 3}, {'value': 'House', 'count': 1},
+        ])
+        self.assertEqual(body['amenities'], [
+            {'value': 'Wifi', 'count': 4}, {'value': 'Kitchen', 'count': 2}, {'value': 'Pool', 'count': 2},
+        ])
+        # 200 opens the upper bin and the closed last bin counts the maximum
+        histogram = [(float(row['min']), float(row['max']), row['count']) for row in body['price']['histogram']]
+        self.assertEqual(histogram, [(100.0, 200.0, 2), (200.0, 300.0, 2)])
+        self.assertEqual((float(body['price']['min']), float(body['price']['max'])), (100.0, 300.0))
+
+    def test_follows_filters(self):
+        body = self.client.get('/api/listings/facets/?minRating=4&bins=1').json()
+        self.assertEqual(body['count'], 2)
+        self.assertEqual([(row['min'], row['count']) for row in body['price']['histogram']], [(body['price']['min'], 2)])
+
+
+class AsyncViewTests(TestCase):
+    # The async views must answer exactly like ListingViewSet
+    client_class = APIClient
+
+    def setUp(self):
+        self.listings = create_listings(5)
+
+    def get(self, path):
+        caches['listings'].clear()
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_list_matches_sync_view(self):
+        for query in ('', '?page_size=2', '?page=2&page_size=2', '?location=new&minRating=4.52',
+                      '?fields=id,title,rating'):
+            with self.subTest(query=query):
+                sync = self.get(f'/api/listings/{query}')
+                body = self.get(f'/api/async/listings/{query}')
+                self.assertTrue(sync['results'])
+                self.assertEqual(body['results'], sync['results'])
+                self.assertEqual(body.get('count'), sync.get('count'))
+                # Following next gives the same following page
+                self.assertEqual(body['next'] is None, sync['next'] is None)
+                if sync['next']:
+                    self.assertEqual(self.get(body['next'])['results'], self.get(sync['next'])['results'])
+
+    def test_detail_matches_sync_view(self):
+        pk = self.listings[0].pk
+        for query in ('', '?expand=host,images,amenities'):
+            with self.subTest(query=query):
+                self.assertEqual(self.get(f'/api/async/listings/{pk}/{query}'),
+                                 self.get(f'/api/listings/{pk}/{query}'))
+        self.assertEqual(self.client.get('/api/async/listings/0/').status_code, 404)
+
+
+class MetricsTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        caches['listings'].clear()
+        create_listings(3)
+
+    def test_server_timing_counts_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/listings/')
+        self.assertEqual(response.status_code, 200)
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertEqual(set(timing), {'db', 'ser', 'app', 'total'})
+        self.assertIn(f'desc="{len(queries.captured_queries)} queries"', timing['db'])
+        self.assertGreater(len(queries.captured_queries), 0)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/listings/'))
+
+    def test_metrics_endpoint(self):
+        key = ('listing-list', 'GET', 200)
+        before = registry.requests[key]
+        observed_before = sum(registry.histograms['listing-list'])
+        queries_before = registry.counters[('db_queries_total', 'listing-list')]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/listings/')
+        # Read before the next request resets the connection's query log
+        expected_queries = queries_before + len(queries.captured_queries)
+
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.content.decode().splitlines()
+        self.assertIn(f'airbnb_api_requests_total{{view="listing-list",method="GET",status="200"}} {before + 1}', lines)
+        self.assertIn(f'airbnb_api_db_queries_total{{view="listing-list"}} {expected_queries}', lines)
+        self.assertIn('airbnb_api_request_duration_seconds_bucket{view="listing-list",le="+Inf"} '
+                      f'{observed_before + 1}', lines)
+        self.assertTrue(any(line.startswith('airbnb_api_slow_queries_total ') for line in lines))
@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ListingViewSet, add_listing
+from .views import ListingViewSet, add_listing, add_listings_bulk
+from .async_views import listing_list, listing_detail
+from .metrics import metrics_view
 
 router = DefaultRouter()
 router.register(r'listings', ListingViewSet, basename='listing')
@@ -8,4 +10,8 @@ router.register(r'listings', ListingViewSet, basename='listing')
 urlpatterns = [
     path('', include(router.urls)),
     path('add_listing/', add_listing, name='add_listing'),
+    path('add_listings_bulk/', add_listings_bulk, name='add_listings_bulk'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('async/listings/', listing_list, name='async-listing-list'),
+    path('async/listings/<int:pk>/', listing_detail, name='async-listing-detail'),
 ]
\ No newline at end of file
@@ -1,70 +1,91 @@
+from collections import Counter
+from django.conf import settings
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
-from django.db.models import Q
-from django.utils.dateparse import parse_date
-from .models import Listing
-from .serializers import ListingSerializer, ListingCreateSerializer
+from rest_framework.decorators import action, api_view, parser_classes
+from rest_framework.parsers import JSONParser
+from .serializers import (
+    ListingSerializer, ListingCardSerializer, ListingCreateSerializer,
+    listing_queryset, selected_fields
+)
+from .parsers import NDJSONParser
+from .filters import filter_listings
+from .pagination import ListingPagination
+from .ingest import ingest_listings
+from .cache import cached_response, get_cache_stats
+from .fastpath import FastListingSerializer
+from .facets import listing_facets, PRICE_BINS, MAX_PRICE_BINS
+from .models import Listing, ListingSearchDoc
+from . import search_docs
 
 class ListingViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = ListingSerializer
+    pagination_class = ListingPagination
+    
+    def get_serializer_class(self):
+        # Search results only need card fields; retrieve renders everything
+        if self.action == 'list':
+            return ListingCardSerializer
+        return ListingSerializer
+    
+    def get_selected_fields(self):
+        if not hasattr(self, '_selected_fields'):
+            self._selected_fields = selected_fields(self.get_serializer_class(), self.request.query_params)
+        return self._selected_fields
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_selected_fields()
+        return context
     
     def get_queryset(self):
-        queryset = Listing.objects.all().order_by('-rating')
-        
-        # Filter by location
-        location = self.request.query_params.get('location')
-        if location:
-            queryset = queryset.filter(location__icontains=location)
-        
-        # Filter by check-in and check-out dates
-        # This is simplified, in a real app you would check availability
-        check_in = self.request.query_params.get('checkIn')
-        check_out = self.request.query_params.get('checkOut')
-        if check_in and check_out:
-            check_in_date = parse_date(check_in)
-            check_out_date = parse_date(check_out)
-            if check_in_date and check_out_date:
-                # In a real app, you would filter based on availability
-                pass
-        
-        # Filter by guests
-        guests = self.request.query_params.get('guests')
-        if guests:
-            try:
-                guests_count = int(guests)
-                queryset = queryset.filter(capacity__gte=guests_count)
-            except ValueError:
-                pass
-        
-        # Filter by price range
-        min_price = self.request.query_params.get('minPrice')
-        max_price = self.request.query_params.get('maxPrice')
-        
-        if min_price:
-            try:
-                min_price_value = float(min_price)
-                queryset = queryset.filter(price_per_night__gte=min_price_value)
-            except ValueError:
-                pass
-                
-        if max_price:
-            try:
-                max_price_value = float(max_price)
-                queryset = queryset.filter(price_per_night__lte=max_price_value)
-            except ValueError:
-                pass
-        
-        # Filter by minimum rating
-        min_rating = self.request.query_params.get('minRating')
-        if min_rating:
-            try:
-                rating_value = float(min_rating)
-                queryset = queryset.filter(rating__gte=rating_value)
-            except ValueError:
-                pass
+        queryset = listing_queryset(self.get_selected_fields())
+        return filter_listings(queryset, self.request.query_params)
+    
+    def list(self, request, *args, **kwargs):
+        if settings.LISTINGS_SEARCH_DOCS and search_docs.can_serve(request.query_params):
+            return cached_response(request, lambda: self.doc_list(request))
+        if settings.LISTINGS_FAST_PATH:
+            return cached_response(request, lambda: self.fast_list(request))
+        return cached_response(request, lambda: super(ListingViewSet, self).list(request, *args, **kwargs))
+    
+    def fast_list(self, request):
+        # Same response as list(), built from .values() rows (see fastpath.py)
+        fast_serializer = FastListingSerializer(self.get_serializer())
+        queryset = fast_serializer.values(self.filter_queryset(self.get_queryset()))
         
-        return queryset
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast_serializer.serialize(page))
+        return Response(fast_serializer.serialize(queryset))
+    
+    def doc_list(self, request):
+        # Same response as list() for default card searches, read from the
+        # precomputed cards in ListingSearchDoc: one table, no joins
+        queryset = filter_listings(ListingSearchDoc.objects.order_by('-rating', '-id'), request.query_params)
+        columns = ['card'] + (['stay_total'] if 'stay_total' in queryset.query.annotations else [])
+        page = self.paginate_queryset(queryset.values('id', 'rating', *columns))
+        if page is not None:
+            return self.get_paginated_response(search_docs.load_cards(page))
+        return Response(search_docs.load_cards(queryset.values(*columns)))
+    
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, lambda: super(ListingViewSet, self).retrieve(request, *args, **kwargs))
+    
+    @action(detail=False)
+    def facets(self, request):
+        # Price histogram, rating buckets, property type and amenity counts
+        # for the current filters, computed by aggregate queries
+        try:
+            bins = min(max(int(request.query_params.get('bins', PRICE_BINS)), 1), MAX_PRICE_BINS)
+        except ValueError:
+            bins = PRICE_BINS
+        queryset = filter_listings(Listing.objects.all(), request.query_params)
+        return cached_response(request, lambda: Response(listing_facets(queryset, bins)))
+    
+    @action(detail=False, url_path='cache-stats')
+    def cache_stats(self, request):
+        return Response(get_cache_stats())
 
 @api_view(['POST'])
 def add_listing(request):
@@ -75,4 +96,61 @@ def add_listing(request):
             {'id': listing.id, 'message': 'Listing created successfully'},
             status=status.HTTP_201_CREATED
         )
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@parser_classes([JSONParser, NDJSONParser])
+def add_listings_bulk(request):
+    # Accepts a JSON array or NDJSON body and writes every valid listing in
+    # one transaction, upserting on external_id. Results are reported per
+    # item, in request order.
+    if not isinstance(request.data, list):
+        return Response(
+            {'error': 'Expected a list of listings'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = [None] * len(request.data)
+    valid = []
+    for index, item in enumerate(request.data):
+        serializer = ListingCreateSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {'index': index, 'status': 'error', 'errors': serializer.errors}
+
+    # A listing repeated in the batch is stored once, from its last
+    # occurrence; earlier ones are reported as duplicates of it
+    last = {}
+    for index, validated_data in valid:
+        if validated_data.get('external_id'):
+            last[validated_data['external_id']] = index
+    winners = [
+        (index, validated_data) for index, validated_data in valid
+        if not validated_data.get('external_id') or last[validated_data['external_id']] == index
+    ]
+
+    ingested = ingest_listings([validated_data for _, validated_data in winners])
+    for (index, _), (listing, listing_status) in zip(winners, ingested):
+        results[index] = {'index': index, 'status': listing_status, 'id': listing.id}
+    for index, validated_data in valid:
+        if results[index] is None:
+            winner = last[validated_data['external_id']]
+            results[index] = {'index': index, 'status': 'duplicate', 'id': results[winner]['id'],
+                              'duplicate_of': winner}
+
+    if not valid and results:
+        response_status = status.HTTP_400_BAD_REQUEST
+    elif len(valid) < len(results):
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_201_CREATED
+    counts = Counter(result['status'] for result in results)
+    return Response({
+        'created': counts['created'],
+        'updated': counts['updated'],
+        'unchanged': counts['unchanged'],
+        'duplicates': counts['duplicate'],
+        'errors': counts['error'],
+        'results': results,
+    }, status=response_status)
@@ -0,0 +1,11 @@
+"""
+ASGI config for django_backend project.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_backend.settings')
+
+application = get_asgi_application()
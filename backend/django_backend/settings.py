@@ -4,6 +4,8 @@ Django settings for django_backend project.
 
 from pathlib import Path
 import os
+import importlib.util
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -34,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'airbnb_api.metrics.PerformanceMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -63,17 +66,75 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'django_backend.wsgi.application'
+ASGI_APPLICATION = 'django_backend.asgi.application'
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': os.getenv('MYSQL_DATABASE', 'airbnb_db'),
-        'USER': os.getenv('MYSQL_USER', 'root'),
-        'PASSWORD': os.getenv('MYSQL_PASSWORD', 'password'),
-        'HOST': os.getenv('MYSQL_HOST', 'localhost'),
-        'PORT': os.getenv('MYSQL_PORT', '3306'),
+# MySQL by default; DB_ENGINE=sqlite uses a local file instead (handy for
+# load tests and development without a MySQL server)
+DB_ENGINE = os.getenv('DB_ENGINE', 'mysql')
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {'timeout': 20},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': os.getenv('MYSQL_DATABASE', 'airbnb_db'),
+            'USER': os.getenv('MYSQL_USER', 'root'),
+            'PASSWORD': os.getenv('MYSQL_PASSWORD', 'password'),
+            'HOST': os.getenv('MYSQL_HOST', 'localhost'),
+            'PORT': os.getenv('MYSQL_PORT', '3306'),
+        }
+    }
+
+# Persistent connections: each worker thread keeps its connection for
+# DB_CONN_MAX_AGE seconds ('none' for no limit, 0 to close after every
+# request) and checks it is still alive before reusing it
+CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', '60')
+DATABASES['default']['CONN_MAX_AGE'] = None if CONN_MAX_AGE.lower() == 'none' else int(CONN_MAX_AGE)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# Optional connection pool shared by all threads of a process, from the
+# django-db-connection-pool package. The pool owns the connections, so
+# Django closes (returns) them after every request.
+if os.getenv('DB_POOL', 'False') == 'True' and DB_ENGINE != 'sqlite':
+    if importlib.util.find_spec('dj_db_conn_pool') is None:
+        raise ImproperlyConfigured('DB_POOL=True requires django-db-connection-pool[mysql]')
+    DATABASES['default']['ENGINE'] = 'dj_db_conn_pool.backends.mysql'
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['POOL_OPTIONS'] = {
+        'POOL_SIZE': int(os.getenv('DB_POOL_SIZE', '10')),
+        'MAX_OVERFLOW': int(os.getenv('DB_POOL_MAX_OVERFLOW', '10')),
+        'RECYCLE': int(os.getenv('DB_POOL_RECYCLE', '3600')),
+        'PRE_PING': True,
     }
+
+# Caches
+# The listings cache holds serialized ListingViewSet responses. It defaults to
+# an in-process LRU with TTL; point it at Redis to share it between workers.
+LISTINGS_CACHE_BACKEND = os.getenv(
+    'LISTINGS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+)
+LISTINGS_CACHE = {
+    'BACKEND': LISTINGS_CACHE_BACKEND,
+    'LOCATION': os.getenv('LISTINGS_CACHE_LOCATION', 'listings'),
+    'TIMEOUT': int(os.getenv('LISTINGS_CACHE_TIMEOUT', '60')),
+}
+if LISTINGS_CACHE_BACKEND.endswith('LocMemCache'):
+    LISTINGS_CACHE['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('LISTINGS_CACHE_MAX_ENTRIES', '1000')),
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'listings': LISTINGS_CACHE,
 }
 
 # Password validation
@@ -114,4 +175,20 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
-}
\ No newline at end of file
+    'DEFAULT_RENDERER_CLASSES': [
+        'airbnb_api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Request instrumentation (airbnb_api.metrics): Server-Timing headers on every
+# response and a warning with SQL and call site for queries slower than this
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+
+# Serve listing search results through the .values()-based fast path
+LISTINGS_FAST_PATH = os.getenv('LISTINGS_FAST_PATH', 'False') == 'True'
+
+# Serve default card searches from the precomputed ListingSearchDoc table
+# (run the rebuild_search_docs command once before enabling)
+LISTINGS_SEARCH_DOCS = os.getenv('LISTINGS_SEARCH_DOCS', 'False') == 'True'
\ No newline at end of file
@@ -0,0 +1,11 @@
+"""
+WSGI config for django_backend project.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_backend.settings')
+
+application = get_wsgi_application()
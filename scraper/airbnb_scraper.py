@@ -1,6 +1,4 @@
-import json
 import argparse
-import requests
 from datetime import datetime
 import time
 import random
@@ -8,17 +6,23 @@ from urllib.parse import urlencode
 import scrapy
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
+from crawl_state import CrawlStateStore, content_hash
+from extract import availability_windows, extract_search_data, extract_listing_data
+from pipelines import sink_settings
 
 class AirbnbSpider(scrapy.Spider):
     name = 'airbnb_spider'
+    custom_settings = {
+        'ITEM_PIPELINES': {'pipelines.ApiBatchPipeline': 300},
+    }
     
-    def __init__(self, location='New York', checkin=None, checkout=None, guests=2, *args, **kwargs):
+    def __init__(self, location='New York', checkin=None, checkout=None, guests=2,
+                 state_path=None, max_age_hours=24, *args, **kwargs):
         super(AirbnbSpider, self).__init__(*args, **kwargs)
         self.location = location
         self.checkin = checkin or (datetime.now().strftime('%Y-%m-%d'))
         self.checkout = checkout or (datetime.now().strftime('%Y-%m-%d'))
         self.guests = int(guests)
-        self.results = []
         
         # Create the search URL
         query_params = {
@@ -29,23 +33,36 @@ class AirbnbSpider(scrapy.Spider):
         }
         self.start_urls = [f'https://www.airbnb.com/s/{self.location.replace(" ", "-")}/homes?{urlencode(query_params)}']
         
+        # Persistent crawl state: skips detail pages fetched within
+        # max_age_hours and resumes from the last search page reached
+        self.state = CrawlStateStore(state_path) if state_path else None
+        self.max_age = float(max_age_hours) * 3600
+        self.search_key = f'{self.location}|{self.checkin}|{self.checkout}|{self.guests}'
+        # Content hashes of yielded listings by external_id, recorded in the
+        # crawl state once a pipeline reports them delivered
+        self.undelivered = {}
+        
         self.logger.info(f"Starting scrape for: {self.start_urls[0]}")
 
+    def start_requests(self):
+        url = self.start_urls[0]
+        if self.state:
+            resume_url = self.state.load_cursor(self.search_key)
+            if resume_url:
+                self.logger.info(f"Resuming interrupted crawl from: {resume_url}")
+                url = resume_url
+        yield scrapy.Request(url=url, callback=self.parse, dont_filter=True)
+
     def parse(self, response):
         # Find the JSON data in the page
-        # Airbnb loads data via JavaScript, so we need to extract it from the page source
-        script_content = response.xpath('//script[contains(text(), "bootstrapData")]/text()').get()
-        
-        if not script_content:
-            self.logger.error("Could not find bootstrapData in the page")
-            return
-        
+        # Airbnb loads data via JavaScript, so we need to extract it from the page source.
+        # Only the listings and pagination subtrees of bootstrapData are decoded.
         try:
-            # Try to extract the JSON data
-            # This is a simplified approach - in a real scenario you'd need to handle this more robustly
-            start_index = script_content.find('{')
-            end_index = script_content.rfind('}') + 1
-            json_data = json.loads(script_content[start_index:end_index])
+            json_data = extract_search_data(response.text)
+            
+            if json_data is None:
+                self.logger.error("Could not find bootstrapData in the page")
+                return
             
             # Extract listing data from the JSON
             # The actual structure will depend on Airbnb's current implementation
@@ -55,7 +72,14 @@ class AirbnbSpider(scrapy.Spider):
                 self.logger.error("Could not extract listings data")
                 return
             
+            # Remember this page so an interrupted crawl resumes here
+            if self.state:
+                self.state.save_cursor(self.search_key, response.url)
+            
             for listing in listings_data:
+                if self.state and self.state.is_fresh(listing.get('id'), self.max_age):
+                    self.crawler.stats.inc_value('crawl_state/skipped_details')
+                    continue
                 yield scrapy.Request(
                     url=f"https://www.airbnb.com/rooms/{listing.get('id')}",
                     callback=self.parse_listing,
@@ -66,6 +90,9 @@ class AirbnbSpider(scrapy.Spider):
             next_page_url = self._extract_next_page(json_data)
             if next_page_url:
                 yield scrapy.Request(url=next_page_url, callback=self.parse)
+            elif self.state:
+                # Last page reached, the next run starts from the beginning
+                self.state.clear_cursor(self.search_key)
                 
         except Exception as e:
             self.logger.error(f"Error parsing JSON data: {e}")
@@ -75,17 +102,25 @@ class AirbnbSpider(scrapy.Spider):
         
         # Extract listing details
         try:
-            # Extract JSON data from the listing page
-            script_content = response.xpath('//script[@id="data-deferred-state"]/text()').get()
-            if script_content:
-                listing_data = json.loads(script_content)
+            # Extract the pdpSections JSON from the listing page
+            listing_data = extract_listing_data(response.text)
+            if listing_data:
                 listing_detail = self._extract_listing_details(listing_data, basic_info)
                 
-                # Send the data to our API
-                self._send_to_api(listing_detail)
-                
-                # Store the results
-                self.results.append(listing_detail)
+                # Skip listings whose content has not changed since the last
+                # fetch; they are already stored in the backend
+                if self.state and listing_detail:
+                    digest = content_hash({
+                        key: value for key, value in listing_detail.items()
+                        if key not in ('check_in', 'check_out')
+                    })
+                    if self.state.is_unchanged(basic_info.get('id'), digest):
+                        # Delivered before; only its fetch time moves on
+                        self.state.record_listing(basic_info.get('id'), digest)
+                        self.crawler.stats.inc_value('crawl_state/unchanged_listings')
+                        return
+                    if listing_detail.get('external_id'):
+                        self.undelivered[listing_detail['external_id']] = digest
                 
                 self.logger.info(f"Scraped listing: {listing_detail.get('title')}")
                 
@@ -171,6 +206,7 @@ class AirbnbSpider(scrapy.Spider):
             # Get host information
             host_data = listing_data.get('host', {})
             host = {
+                'id': host_data.get('id'),
                 'name': host_data.get('name', ''),
                 'isSuperhost': host_data.get('isSuperhost', False),
                 'profileImage': host_data.get('avatar', {}).get('url', ''),
@@ -185,8 +221,12 @@ class AirbnbSpider(scrapy.Spider):
                 for photo in listing_data['photos'].get('data', []):
                     images.append(photo.get('picture', ''))
             
+            # Get the availability calendar, when the page has one
+            calendar_months = listing_data.get('availabilityCalendar', {}).get('calendarMonths')
+            
             # Combine with basic info
             result = {
+                'external_id': str(basic_info['id']) if basic_info.get('id') else None,
                 'title': basic_info.get('title', listing_data.get('title', '')),
                 'location': basic_info.get('location', ''),
                 'address': listing_data.get('location', {}).get('address', ''),
@@ -209,36 +249,54 @@ class AirbnbSpider(scrapy.Spider):
                 'check_in': self.checkin,
                 'check_out': self.checkout
             }
+            if calendar_months is not None:
+                result['availability'] = availability_windows(calendar_months)
             
             return result
         
         except Exception as e:
             self.logger.error(f"Error extracting listing details: {e}")
             return {}
-    
-    def _send_to_api(self, listing_data):
-        # Send the listing data to our API
-        try:
-            api_url = 'http://localhost:8000/api/add_listing/'
-            headers = {'Content-Type': 'application/json'}
-            
-            response = requests.post(
-                api_url,
-                data=json.dumps(listing_data),
-                headers=headers
-            )
-            
-            if response.status_code == 201:
-                self.logger.info(f"Successfully sent listing to API: {listing_data.get('title')}")
-            else:
-                self.logger.error(f"Failed to send listing to API. Status code: {response.status_code}, Response: {response.text}")
-        
-        except Exception as e:
-            self.logger.error(f"Error sending data to API: {e}")
 
-def run_spider(location, checkin, checkout, guests):
+    def listings_delivered(self, external_ids):
+        # Called by the pipelines once listings are stored by the API or in
+        # a complete output file
+        for external_id in external_ids:
+            digest = self.undelivered.pop(external_id, None)
+            if self.state and digest is not None:
+                self.state.record_listing(external_id, digest)
+
+    def closed(self, reason):
+        if not self.state:
+            return
+        stats = self.crawler.stats
+        skipped = stats.get_value('crawl_state/skipped_details', 0)
+        unchanged = stats.get_value('crawl_state/unchanged_listings', 0)
+        self.logger.info(
+            f"Crawl state: skipped {skipped} fresh detail requests, "
+            f"{unchanged} unchanged listings not re-sent to the API, "
+            f"{len(self.undelivered)} listings not delivered and left to the next crawl"
+        )
+        self.state.close()
+
+def replay_settings(settings, replay_dir=None, record_dir=None):
+    # Serve pages from a recorded directory instead of the live site, or
+    # record the live pages for later replay
+    middlewares = dict(settings.getdict('DOWNLOADER_MIDDLEWARES'))
+    if replay_dir:
+        settings.set('REPLAY_DIR', replay_dir)
+        middlewares['replay.ReplayMiddleware'] = 50
+    if record_dir:
+        settings.set('RECORD_DIR', record_dir)
+        middlewares['replay.RecordMiddleware'] = 950
+    settings.set('DOWNLOADER_MIDDLEWARES', middlewares)
+    return settings
+
+def run_spider(location, checkin, checkout, guests, state_path=None, max_age_hours=24,
+               replay_dir=None, record_dir=None, output_dir=None, output_format='ndjson'):
     # Set up the Scrapy crawler
-    process = CrawlerProcess(get_project_settings())
+    settings = replay_settings(get_project_settings(), replay_dir, record_dir)
+    process = CrawlerProcess(sink_settings(settings, output_dir, output_format))
     
     # Add our spider with the provided parameters
     process.crawl(
@@ -246,7 +304,9 @@ def run_spider(location, checkin, checkout, guests):
         location=location,
         checkin=checkin,
         checkout=checkout,
-        guests=guests
+        guests=guests,
+        state_path=state_path,
+        max_age_hours=max_age_hours
     )
     
     # Start the crawling process
@@ -258,8 +318,45 @@ if __name__ == "__main__":
     parser.add_argument('--checkin', type=str, help='Check-in date (YYYY-MM-DD)')
     parser.add_argument('--checkout', type=str, help='Check-out date (YYYY-MM-DD)')
     parser.add_argument('--guests', type=int, default=2, help='Number of guests')
+    parser.add_argument('--state', type=str, default='crawl_state.sqlite3',
+                        help='Crawl state database (empty string to disable)')
+    parser.add_argument('--max-age', type=float, default=24,
+                        help='Hours before an already fetched listing is fetched again')
+    parser.add_argument('--output', type=str,
+                        help='Write listings to files in this directory instead of sending them to the API')
+    parser.add_argument('--format', type=str, choices=['ndjson', 'parquet'], default='ndjson',
+                        help='Output file format for --output')
+    parser.add_argument('--record', type=str, help='Save every fetched page to this directory')
+    parser.add_argument('--replay', type=str, help='Serve pages from a recorded directory instead of the live site')
+    
+    # Scheduler mode: many (location, checkin, checkout, guests) jobs
+    parser.add_argument('--jobs', type=str, help='CSV or NDJSON file of jobs to queue and run')
+    parser.add_argument('--queue', type=str, help='Job queue database (runs pending jobs when given without --jobs)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Spiders running at once per process')
+    parser.add_argument('--processes', type=int, default=1, help='Worker processes')
+    parser.add_argument('--domain-concurrency', type=int, default=8,
+                        help='Concurrent requests to Airbnb across all spiders')
+    parser.add_argument('--domain-delay', type=float, default=0.25,
+                        help='Seconds between requests to Airbnb across all spiders')
     
     args = parser.parse_args()
     
-    # Run the spider
-    run_spider(args.location, args.checkin, args.checkout, args.guests)
\ No newline at end of file
+    if args.jobs or args.queue:
+        from scheduler import run_scheduler
+        run_scheduler(
+            args.jobs, args.queue or 'jobs.sqlite3',
+            concurrency=args.concurrency,
+            processes=args.processes,
+            domain_concurrency=args.domain_concurrency,
+            domain_delay=args.domain_delay,
+            state_path=args.state or None,
+            max_age_hours=args.max_age,
+            output_dir=args.output,
+            output_format=args.format
+        )
+    else:
+        # Run the spider
+        run_spider(args.location, args.checkin, args.checkout, args.guests,
+                   state_path=args.state or None, max_age_hours=args.max_age,
+                   replay_dir=args.replay, record_dir=args.record,
+                   output_dir=args.output, output_format=args.format)
\ No newline at end of file
@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import random
+import tempfile
+import resource
+import argparse
+import threading
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from pipelines import ApiBatchPipeline, api_payload, build_session
+from extract import extract_search_data, extract_listing_data
+from replay import MANIFEST, fixture_name, load_manifest
+
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    # Stand-in for the Django ingestion endpoints: accepts a single listing or
+    # a list of them and answers like add_listing / add_listings_bulk,
+    # rejecting listings without the fields ListingCreateSerializer requires
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        time.sleep(self.server.latency)
+
+        if isinstance(payload, list):
+            results = []
+            for idx, listing in enumerate(payload):
+                errors = missing_fields(listing)
+                if errors:
+                    results.append({'index': idx, 'status': 'error', 'errors': errors})
+                else:
+                    results.append({'index': idx, 'status': 'created', 'id': idx})
+            created = sum(1 for result in results if result['status'] == 'created')
+            body = {'created': created, 'errors': len(results) - created, 'results': results}
+            if not created and results:
+                status = 400
+            elif created < len(results):
+                status = 207
+            else:
+                status = 201
+        else:
+            body = missing_fields(payload)
+            status = 400 if body else 201
+            if not body:
+                body = {'id': 1, 'message': 'Listing created successfully'}
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Fields ListingCreateSerializer requires, by their API names
+REQUIRED_FIELDS = ('title', 'location', 'price_per_night', 'rating', 'description', 'property_type',
+                   'capacity', 'bedrooms', 'beds', 'baths', 'host_data', 'images', 'amenities')
+
+
+def missing_fields(listing):
+    return {name: ['This field is required.'] for name in REQUIRED_FIELDS if name not in listing}
+
+
+def start_stub_server(latency):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubApiHandler)
+    server.latency = latency
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def sample_listing(idx):
+    return {
+        'title': f'Benchmark listing {idx}',
+        'location': 'New York',
+        'address': f'{idx} Broadway, New York, NY',
+        'latitude': 40.7,
+        'longitude': -74.0,
+        'price_per_night': 150.0,
+        'currency': 'USD',
+        'total_price': 1050.0,
+        'rating': 4.8,
+        'reviews': 120,
+        'description': 'A bright apartment close to the subway. ' * 20,
+        'amenities': ['Wifi', 'Kitchen', 'Air conditioning', 'Washer'],
+        'host': {'name': 'Host', 'isSuperhost': True, 'profileImage': '', 'joinDate': '2019'},
+        'images': [f'https://a0.muscache.com/im/pictures/{idx}-{n}.jpg' for n in range(10)],
+        'property_type': 'Entire home',
+        'capacity': 4,
+        'bedrooms': 2,
+        'beds': 2,
+        'baths': 1,
+        'check_in': '2025-06-01',
+        'check_out': '2025-06-08',
+    }
+
+
+def bench_api_sink(args):
+    server = start_stub_server(args.latency)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    listings = [sample_listing(idx) for idx in range(args.listings)]
+
+    # Before: one blocking POST on a fresh connection per listing
+    started = time.perf_counter()
+    for listing in listings:
+        requests.post(
+            f'{base_url}/api/add_listing/',
+            data=json.dumps(api_payload(listing)),
+            headers={'Content-Type': 'application/json'}
+        )
+    per_listing = time.perf_counter() - started
+
+    # After: batches over the pipeline's pooled session, flushed from a
+    # thread pool the same way the reactor does
+    pipeline = ApiBatchPipeline(
+        f'{base_url}/api/add_listings_bulk/',
+        batch_size=args.batch_size,
+        pool_size=args.threads
+    )
+    pipeline.session = build_session(pool_size=args.threads)
+    batches = [listings[idx:idx + args.batch_size] for idx in range(0, len(listings), args.batch_size)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(pipeline.post_batch, batches))
+    batched = time.perf_counter() - started
+    pipeline.session.close()
+    server.shutdown()
+
+    print(f"listings: {args.listings}, stub latency: {args.latency * 1000:.1f} ms")
+    print(f"per-listing POST:  {args.listings / per_listing:10.1f} listings/sec")
+    print(f"batched pipeline:  {args.listings / batched:10.1f} listings/sec "
+          f"(batch size {args.batch_size}, {args.threads} threads)")
+
+
+def synthetic_search_page(target_mb, seed=0, next_page='/s/New-York/homes?cursor=2'):
+    # A search page whose bootstrapData carries a realistic listings section
+    # buried in target_mb of unrelated state, like the real site
+    rng = random.Random(seed)
+    listings = [{
+        'id': str(rng.randint(10 ** 7, 10 ** 8)),
+        'title': f'Listing {idx}',
+        'location': {'city': 'New York'},
+        'price': {'rate': rng.randint(50, 500), 'currency': 'USD'},
+        'rating': {'value': round(rng.uniform(3.5, 5), 2)},
+        'reviewsCount': rng.randint(0, 500),
+        'image': {'url': f'https://a0.muscache.com/im/pictures/{idx}.jpg'},
+    } for idx in range(20)]
+    filler = []
+    size = 0
+    while size < target_mb * 1024 * 1024:
+        block = {'id': rng.random(), 'text': 'lorem ipsum ' * 40, 'values': list(range(50))}
+        filler.append(block)
+        size += len(json.dumps(block))
+    bootstrap = {'data': {
+        'niobeClientData': filler,
+        'presentation': {
+            'exploreV3': {'sections': [{'listings': listings}]},
+            'pagination': {'nextPage': next_page},
+        },
+    }}
+    return f'<html><head><script>window.bootstrapData = {json.dumps(bootstrap)};</script></head></html>'
+
+
+def synthetic_room_page(listing_id, filler_kb, rng):
+    # A room page whose data-deferred-state carries the pdpSections the
+    # spider reads, next to filler_kb of unrelated state
+    sections = {
+        'description': {'description': 'A quiet apartment near the park. ' * 10},
+        'host': {
+            'id': str(rng.randint(10 ** 6, 10 ** 7)),
+            'name': rng.choice(['Ana', 'Ben', 'Chen', 'Dara']),
+            'isSuperhost': rng.random() < 0.3,
+            'avatar': {'url': f'https://a0.muscache.com/im/users/{listing_id}.jpg'},
+            'memberSince': '2019',
+        },
+        'photos': {'data': [
+            {'picture': f'https://a0.muscache.com/im/pictures/{listing_id}-{idx}.jpg'} for idx in range(5)
+        ]},
+        'amenities': {'sections': [{'items': [
+            {'title': title} for title in rng.sample(['Wifi', 'Kitchen', 'Pool', 'Free parking', 'Washer'], 3)
+        ]}]},
+        'location': {
+            'address': f'{rng.randint(1, 999)} Main Street',
+            'lat': 40.7 + rng.uniform(-0.2, 0.2),
+            'lng': -74.0 + rng.uniform(-0.2, 0.2),
+        },
+        'basicInfo': {'capacity': rng.randint(1, 8), 'bedroomCount': 2, 'bedCount': 2, 'bathroomCount': 1},
+        'roomAndPropertyType': {'roomType': 'Entire home'},
+    }
+    state = {
+        'niobeMinimalClientData': [{'data': {'presentation': {'pdpSections': sections}}}],
+        'filler': 'x' * int(filler_kb * 1024),
+    }
+    return f'<html><body><script id="data-deferred-state">{json.dumps(state)}</script></body></html>'
+
+
+def write_synthetic_fixtures(directory, search_pages, page_mb, room_kb, seed=0):
+    # A replay directory (see replay.py) of search_pages linked search pages
+    # and a room page for each of their listings
+    rng = random.Random(seed)
+    manifest = {'start_urls': [], 'pages': {}}
+
+    def save(url, html):
+        manifest['pages'][url] = fixture_name(url)
+        with open(os.path.join(directory, fixture_name(url)), 'w', encoding='utf-8') as fixture:
+            fixture.write(html)
+
+    for page in range(search_pages):
+        url = f'https://www.airbnb.com/s/New-York/homes?cursor={page + 1}'
+        next_page = f'/s/New-York/homes?cursor={page + 2}' if page + 1 < search_pages else None
+        html = synthetic_search_page(page_mb, seed + page, next_page)
+        save(url, html)
+        if page == 0:
+            manifest['start_urls'].append(url)
+        for section in extract_search_data(html)['data']['presentation']['exploreV3']['sections']:
+            for listing in section['listings']:
+                save(f"https://www.airbnb.com/rooms/{listing['id']}", synthetic_room_page(listing['id'], room_kb, rng))
+
+    with open(os.path.join(directory, MANIFEST), 'w') as index:
+        json.dump(manifest, index, indent=2)
+    return len(manifest['pages'])
+
+
+def full_parse(html):
+    # The extraction the spider used before: DOM + whole-script json.loads
+    from parsel import Selector
+    selector = Selector(text=html)
+    script = selector.xpath('//script[contains(text(), "bootstrapData")]/text()').get()
+    if script is None:
+        script = selector.xpath('//script[@id="data-deferred-state"]/text()').get()
+        return json.loads(script)
+    return json.loads(script[script.find('{'):script.rfind('}') + 1])
+
+
+def streaming_parse(html):
+    if 'bootstrapData' in html:
+        return extract_search_data(html)
+    return extract_listing_data(html)
+
+
+def _extract_worker(mode, pages, repeat, results):
+    # Runs in a fresh process so that neither mode inherits the other's heap
+    parse = full_parse if mode == 'full' else streaming_parse
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            parse(html)
+    elapsed = time.perf_counter() - started
+
+    # Peak memory of one parse over what was allocated before it, traced in
+    # a pass of its own as tracing slows parsing down. tracemalloc sees the
+    # Python objects (the parsed JSON, copies of the script text) but not
+    # lxml's C-level DOM, so the full parse's figure is a lower bound.
+    tracemalloc.start()
+    peak = 0
+    for html in pages:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        data = parse(html)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        del data
+    tracemalloc.stop()
+    results.put((mode, elapsed, peak))
+
+
+def bench_extract(args):
+    if args.fixtures:
+        pages = []
+        for name in sorted(os.listdir(args.fixtures)):
+            if name.endswith('.html'):
+                with open(os.path.join(args.fixtures, name), encoding='utf-8') as page:
+                    pages.append(page.read())
+    else:
+        pages = [synthetic_search_page(args.synthetic_mb, seed) for seed in range(3)]
+    total_mb = sum(len(html.encode()) for html in pages) * args.repeat / (1024 * 1024)
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    print(f"{len(pages)} pages, {total_mb / args.repeat:.1f} MB, {args.repeat} passes")
+    for mode in ('full', 'streaming'):
+        worker = context.Process(target=_extract_worker, args=(mode, pages, args.repeat, results))
+        worker.start()
+        mode, elapsed, peak = results.get()
+        worker.join()
+        print(f"{mode:<10} {total_mb / elapsed:8.1f} MB/s  "
+              f"{elapsed * 1000 / (len(pages) * args.repeat):8.2f} ms/page  "
+              f"peak {peak / 1024:10.1f} KB allocated per page")
+
+
+def bench_crawl(args):
+    # End-to-end crawl of a recorded fixture directory (or of generated
+    # pages without one): no network, the API sink posting to the stub
+    # server, and parse CPU measured per callback
+    if args.fixtures:
+        _crawl(args, args.fixtures)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        pages = write_synthetic_fixtures(directory, args.search_pages, args.synthetic_mb, args.room_kb)
+        print(f"Generated {pages} synthetic pages ({args.search_pages} search pages)")
+        _crawl(args, directory)
+
+
+def _crawl(args, fixtures):
+    from scrapy import Request
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    from airbnb_scraper import AirbnbSpider, replay_settings
+
+    start_urls = load_manifest(fixtures)['start_urls']
+    if not start_urls:
+        raise SystemExit(f"No start URL recorded in {fixtures}; record a crawl with --record first")
+
+    class TimedSpider(AirbnbSpider):
+        name = 'airbnb_benchmark'
+        parse_cpu = 0.0
+
+        def start_requests(self):
+            for url in start_urls:
+                yield Request(url=url, callback=self.parse, dont_filter=True)
+
+        def parse(self, response):
+            started = time.process_time()
+            for result in super().parse(response):
+                self.parse_cpu += time.process_time() - started
+                yield result
+                started = time.process_time()
+            self.parse_cpu += time.process_time() - started
+
+        def parse_listing(self, response):
+            started = time.process_time()
+            try:
+                return super().parse_listing(response)
+            finally:
+                self.parse_cpu += time.process_time() - started
+
+    server = start_stub_server(args.latency)
+    settings = replay_settings(get_project_settings(), replay_dir=fixtures)
+    settings.set('API_BULK_URL', f'http://127.0.0.1:{server.server_address[1]}/api/add_listings_bulk/')
+    settings.set('API_BATCH_SIZE', args.batch_size)
+    settings.set('AUTOTHROTTLE_ENABLED', False)
+    settings.set('DOWNLOAD_DELAY', 0)
+    settings.set('ROBOTSTXT_OBEY', False)
+    settings.set('LOG_LEVEL', 'WARNING')
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(TimedSpider)
+    process.crawl(crawler, location=args.location)
+    started = time.perf_counter()
+    process.start()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    stats = crawler.stats.get_stats()
+    pages = stats.get('response_received_count', 0)
+    batches = stats.get('api_sink/batches', 0)
+    # ru_maxrss is in KB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"pages: {pages} ({stats.get('replay/missing', 0)} missing), "
+          f"items: {stats.get('item_scraped_count', 0)}, {elapsed:.2f} s")
+    print(f"throughput:    {pages / elapsed if elapsed else 0:10.1f} pages/sec")
+    print(f"parse CPU:     {crawler.spider.parse_cpu * 1000 / pages if pages else 0:10.2f} ms/page")
+    print(f"peak RSS:      {peak / 1024:10.1f} MB")
+    print(f"sink latency:  {stats.get('api_sink/latency_total_ms', 0) / batches if batches else 0:10.1f} ms/batch avg, "
+          f"{stats.get('api_sink/latency_max_ms', 0):.1f} ms max ({batches} batches)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scraper benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    api_sink = subparsers.add_parser('api-sink', help='Per-listing POST vs batched API pipeline')
+    api_sink.add_argument('--listings', type=int, default=2000, help='Number of listings to send')
+    api_sink.add_argument('--latency', type=float, default=0.002, help='Stub server latency per request (s)')
+    api_sink.add_argument('--batch-size', type=int, default=50, help='Pipeline batch size')
+    api_sink.add_argument('--threads', type=int, default=10, help='Flush threads (reactor pool size)')
+    api_sink.set_defaults(func=bench_api_sink)
+
+    extract = subparsers.add_parser('extract', help='Full vs streaming JSON extraction of saved pages')
+    extract.add_argument('--fixtures', type=str, help='Directory of saved search/room .html pages')
+    extract.add_argument('--synthetic-mb', type=float, default=5,
+                         help='Size of generated search pages when no fixtures are given')
+    extract.add_argument('--repeat', type=int, default=5, help='Passes over the pages')
+    extract.set_defaults(func=bench_extract)
+
+    crawl = subparsers.add_parser('crawl', help='Full crawl replayed from a recorded or generated fixture directory')
+    crawl.add_argument('--fixtures', type=str,
+                       help='Directory written by airbnb_scraper.py --record (generated pages if omitted)')
+    crawl.add_argument('--search-pages', type=int, default=10, help='Generated search pages of 20 listings each')
+    crawl.add_argument('--synthetic-mb', type=float, default=1, help='Size of each generated search page')
+    crawl.add_argument('--room-kb', type=float, default=200, help='Size of each generated room page')
+    crawl.add_argument('--location', type=str, default='New York', help='Location the fixtures were recorded for')
+    crawl.add_argument('--latency', type=float, default=0.002, help='Stub server latency per request (s)')
+    crawl.add_argument('--batch-size', type=int, default=50, help='Pipeline batch size')
+    crawl.set_defaults(func=bench_crawl)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+
+def content_hash(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class CrawlStateStore:
+    # On-disk record of which listings were fetched when, with a hash of
+    # their content, plus the last search page reached per search so an
+    # interrupted crawl can resume there
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS listings (
+                listing_id TEXT PRIMARY KEY,
+                content_hash TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cursors (
+                search_key TEXT PRIMARY KEY,
+                page_url TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        ''')
+        self.connection.commit()
+
+    def is_fresh(self, listing_id, max_age):
+        # True if the listing was fetched less than max_age seconds ago
+        row = self.connection.execute(
+            'SELECT fetched_at FROM listings WHERE listing_id = ?', (str(listing_id),)
+        ).fetchone()
+        return row is not None and time.time() - row[0] < max_age
+
+    def is_unchanged(self, listing_id, digest):
+        # True if the listing was delivered before with the same content hash
+        row = self.connection.execute(
+            'SELECT content_hash FROM listings WHERE listing_id = ?', (str(listing_id),)
+        ).fetchone()
+        return row is not None and row[0] == digest
+
+    def record_listing(self, listing_id, digest):
+        # Store the listing's content hash and fetch time; call it only once
+        # the listing has been delivered, or a failed delivery would leave
+        # it marked fresh and unchanged and it would never be sent again
+        self.connection.execute(
+            'INSERT OR REPLACE INTO listings (listing_id, content_hash, fetched_at) VALUES (?, ?, ?)',
+            (str(listing_id), digest, time.time())
+        )
+        self.connection.commit()
+
+    def load_cursor(self, search_key):
+        row = self.connection.execute(
+            'SELECT page_url FROM cursors WHERE search_key = ?', (search_key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_cursor(self, search_key, page_url):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO cursors (search_key, page_url, updated_at) VALUES (?, ?, ?)',
+            (search_key, page_url, time.time())
+        )
+        self.connection.commit()
+
+    def clear_cursor(self, search_key):
+        self.connection.execute('DELETE FROM cursors WHERE search_key = ?', (search_key,))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
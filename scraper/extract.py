@@ -0,0 +1,118 @@
+import datetime
+import json
+
+# Incremental extraction of the JSON embedded in Airbnb pages. Instead of
+# building a DOM for the whole page and json.loads-ing the entire script
+# (often several MB), the script is located by plain string search and only
+# the subtrees the spider reads are decoded, in place, with raw_decode.
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def find_script(html, marker):
+    # (start, end) of the body of the <script> element containing marker
+    position = html.find(marker)
+    if position == -1:
+        return None
+    tag_start = html.rfind('<script', 0, position)
+    if tag_start == -1:
+        return None
+    body_start = html.find('>', tag_start) + 1
+    body_end = html.find('</script>', position)
+    if body_start == 0 or body_end == -1:
+        return None
+    return body_start, body_end
+
+
+def iter_values(text, key, start=0, end=None):
+    # Decode the value of every "key": member between start and end,
+    # skipping whatever does not decode (e.g. the key inside a string)
+    end = len(text) if end is None else end
+    needle = f'"{key}"'
+    position = text.find(needle, start, end)
+    while position != -1:
+        index = position + len(needle)
+        while index < end and text[index] in _WHITESPACE:
+            index += 1
+        if index < end and text[index] == ':':
+            index += 1
+            while index < end and text[index] in _WHITESPACE:
+                index += 1
+            try:
+                value, value_end = _decoder.raw_decode(text, index)
+            except ValueError:
+                value_end = None
+            if value_end is not None and value_end <= end:
+                yield value
+        position = text.find(needle, position + 1, end)
+
+
+def first_value(text, key, start=0, end=None, accept=None):
+    for value in iter_values(text, key, start, end):
+        if accept is None or accept(value):
+            return value
+    return None
+
+
+def load_script(text, start, end):
+    # Full decode of the outermost object in the script; the fallback when
+    # the expected keys are not found
+    object_start = text.find('{', start, end)
+    object_end = text.rfind('}', start, end) + 1
+    if object_start == -1 or object_end == 0:
+        return None
+    return json.loads(text[object_start:object_end])
+
+
+def extract_search_data(html):
+    # The parts of a search page's bootstrapData the spider reads, in the
+    # same shape as the full document
+    bounds = find_script(html, 'bootstrapData')
+    if bounds is None:
+        return None
+
+    explore = first_value(html, 'exploreV3', *bounds, accept=lambda value: isinstance(value, dict))
+    if explore is None:
+        return load_script(html, *bounds)
+    pagination = first_value(
+        html, 'pagination', *bounds,
+        accept=lambda value: isinstance(value, dict) and 'nextPage' in value
+    )
+    return {'data': {'presentation': {'exploreV3': explore, 'pagination': pagination or {}}}}
+
+
+def extract_listing_data(html):
+    # The pdpSections subtree of a room page's data-deferred-state script,
+    # in the same shape as the full document
+    bounds = find_script(html, 'id="data-deferred-state"')
+    if bounds is None:
+        return None
+
+    pdp_sections = first_value(html, 'pdpSections', *bounds, accept=lambda value: isinstance(value, dict))
+    if pdp_sections is None:
+        return load_script(html, *bounds)
+    return {'niobeMinimalClientData': [{'data': {'presentation': {'pdpSections': pdp_sections}}}]}
+
+
+def availability_windows(calendar_months):
+    # Bookable nights of a listing's availability calendar as date ranges
+    # [start, end) with one nightly price each; consecutive free nights at
+    # the same price share a window. Dates are ISO strings.
+    windows = []
+    for month in calendar_months or []:
+        for day in month.get('days') or []:
+            date = day.get('calendarDate')
+            if not date or not day.get('available'):
+                continue
+            price = (day.get('price') or {}).get('amount')
+            night_end = _next_day(date)
+            if windows and windows[-1]['end'] == date and windows[-1]['nightly_price'] == price:
+                windows[-1]['end'] = night_end
+            else:
+                windows.append({'start': date, 'end': night_end, 'nightly_price': price})
+    return windows
+
+
+def _next_day(date):
+    return (datetime.date.fromisoformat(date) + datetime.timedelta(days=1)).isoformat()
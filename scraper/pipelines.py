@@ -0,0 +1,343 @@
+import os
+import abc
+import gzip
+import json
+import time
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from twisted.internet import defer, task, threads
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Spider item keys that the ingestion API names differently (the same
+# mapping as the backend's load_listings.SCRAPED_KEYS)
+API_KEYS = {'host': 'host_data', 'reviews': 'num_reviews'}
+
+
+class ApiSinkError(Exception):
+    pass
+
+
+def api_payload(item):
+    return {API_KEYS.get(key, key): value for key, value in item.items()}
+
+
+def notify_delivered(spider, external_ids):
+    # Lets the spider record crawl state for listings that were stored
+    callback = getattr(spider, 'listings_delivered', None)
+    if callback is not None:
+        callback([external_id for external_id in external_ids if external_id])
+
+
+def build_session(max_retries=3, backoff_factor=0.5, pool_size=10):
+    # Keep-alive session shared by all flushes. Connection errors and
+    # transient server errors are retried with exponential backoff.
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['POST']),
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Content-Type': 'application/json'})
+    return session
+
+
+class ApiBatchPipeline:
+    # Buffers scraped listings and posts them to the bulk ingestion endpoint
+    # when the buffer is full or the flush interval elapses. The HTTP call
+    # runs in the reactor thread pool so parsing is never blocked on it.
+
+    def __init__(self, api_url, batch_size=50, flush_interval=5.0, max_retries=3,
+                 backoff_factor=0.5, timeout=30, pool_size=10, stats=None):
+        self.api_url = api_url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.stats = stats
+        self.buffer = []
+        self.pending = set()
+        self.session = None
+        self.flush_loop = None
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            api_url=settings.get('API_BULK_URL', 'http://localhost:8000/api/add_listings_bulk/'),
+            batch_size=settings.getint('API_BATCH_SIZE', 50),
+            flush_interval=settings.getfloat('API_FLUSH_INTERVAL', 5.0),
+            max_retries=settings.getint('API_MAX_RETRIES', 3),
+            backoff_factor=settings.getfloat('API_BACKOFF_FACTOR', 0.5),
+            timeout=settings.getfloat('API_TIMEOUT', 30),
+            pool_size=settings.getint('REACTOR_THREADPOOL_MAXSIZE', 10),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        self.spider = spider
+        self.session = build_session(self.max_retries, self.backoff_factor, self.pool_size)
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    def process_item(self, item, spider):
+        self.buffer.append(dict(item))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        return item
+
+    def close_spider(self, spider):
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+
+        # Drain whatever is still buffered and wait for in-flight batches
+        self.flush()
+        finished = defer.DeferredList(list(self.pending))
+        finished.addBoth(lambda _: self.session.close())
+        return finished
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        batch, self.buffer = self.buffer, []
+        d = threads.deferToThread(self._timed_post, batch)
+        d.addCallbacks(self._sent, self._failed, callbackArgs=(batch,), errbackArgs=(batch,))
+        d.addBoth(self._done, d)
+        self.pending.add(d)
+
+    def post_batch(self, batch):
+        # Blocking; runs off the reactor thread
+        payload = [api_payload(item) for item in batch]
+        response = self.session.post(self.api_url, data=json.dumps(payload), timeout=self.timeout)
+        if response.status_code not in (201, 207):
+            raise ApiSinkError(f"Status code: {response.status_code}, Response: {response.text}")
+        return response.json()
+
+    def _timed_post(self, batch):
+        started = time.perf_counter()
+        result = self.post_batch(batch)
+        return result, (time.perf_counter() - started) * 1000
+
+    def _sent(self, timed_result, batch):
+        result, latency_ms = timed_result
+        self._inc_stat('api_sink/batches')
+        self._inc_stat('api_sink/latency_total_ms', latency_ms)
+        if self.stats is not None:
+            self.stats.max_value('api_sink/latency_max_ms', latency_ms)
+        for key in ('created', 'updated', 'unchanged', 'errors'):
+            self._inc_stat(f'api_sink/{key}', result.get(key, 0))
+        self.spider.logger.info(
+            f"Sent {len(batch)} listings to API: {result.get('created', 0)} created, "
+            f"{result.get('updated', 0)} updated, {result.get('unchanged', 0)} unchanged, "
+            f"{result.get('errors', 0)} rejected"
+        )
+        rejected = {row.get('index') for row in result.get('results', []) if row.get('status') == 'error'}
+        notify_delivered(self.spider, [
+            item.get('external_id') for index, item in enumerate(batch) if index not in rejected
+        ])
+
+    def _failed(self, failure, batch):
+        self._inc_stat('api_sink/failed', len(batch))
+        self.spider.logger.error(f"Failed to send {len(batch)} listings to API: {failure.getErrorMessage()}")
+
+    def _done(self, result, d):
+        self.pending.discard(d)
+        return result
+
+    def _inc_stat(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+
+
+class FileSinkPipeline(abc.ABC):
+    # Writes listings to local files as they are scraped, so that crawling
+    # does not depend on the backend being up; load them afterwards with the
+    # backend's load_listings command. Files are written under a .part
+    # name and renamed when complete, and a new file is started every
+    # max_items listings, so memory use does not grow with the crawl.
+    extension = None
+
+    def __init__(self, output_dir, max_items=10000, stats=None):
+        self.output_dir = output_dir
+        self.max_items = max_items
+        self.stats = stats
+        # Several spiders and processes may share one output directory
+        self.prefix = f'listings-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.sequence = 0
+        self.items = 0
+        self.path = None
+        # external_ids written to the current file
+        self.written = []
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            output_dir=settings.get('OUTPUT_DIR', 'output'),
+            max_items=settings.getint('OUTPUT_MAX_ITEMS', 10000),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        self.spider = spider
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def process_item(self, item, spider):
+        if self.path is None:
+            self.sequence += 1
+            self.path = os.path.join(self.output_dir, f'{self.prefix}-{self.sequence:04d}{self.extension}')
+            self.open_file(self.path + '.part')
+
+        self.write(dict(item))
+        self.written.append(item.get('external_id'))
+        self.items += 1
+        if self.stats is not None:
+            self.stats.inc_value('file_sink/items')
+        if self.items >= self.max_items:
+            self.rotate()
+        return item
+
+    def close_spider(self, spider):
+        self.rotate()
+
+    def rotate(self):
+        if self.path is None:
+            return
+        self.close_file()
+        os.replace(self.path + '.part', self.path)
+        if self.stats is not None:
+            self.stats.inc_value('file_sink/files')
+        # Listings count as delivered once their file is complete
+        written, self.written = self.written, []
+        notify_delivered(self.spider, written)
+        self.path = None
+        self.items = 0
+
+    # The file format: subclasses set the extension and implement these
+    @abc.abstractmethod
+    def open_file(self, path):
+        pass
+
+    @abc.abstractmethod
+    def write(self, item):
+        pass
+
+    @abc.abstractmethod
+    def close_file(self):
+        pass
+
+
+class NDJSONFilePipeline(FileSinkPipeline):
+    # One listing per line, gzip-compressed
+    extension = '.ndjson.gz'
+
+    def open_file(self, path):
+        self.file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+
+    def write(self, item):
+        self.file.write(json.dumps(item, ensure_ascii=False))
+        self.file.write('\n')
+
+    def close_file(self):
+        self.file.close()
+        self.file = None
+
+
+def parquet_schema():
+    # Fixed schema so that every file has the same columns regardless of
+    # which values a batch happens to contain. The host is kept as a JSON
+    # string since its fields vary between listings.
+    return pyarrow.schema([
+        ('external_id', pyarrow.string()),
+        ('title', pyarrow.string()),
+        ('location', pyarrow.string()),
+        ('address', pyarrow.string()),
+        ('latitude', pyarrow.float64()),
+        ('longitude', pyarrow.float64()),
+        ('price_per_night', pyarrow.float64()),
+        ('currency', pyarrow.string()),
+        ('total_price', pyarrow.float64()),
+        ('rating', pyarrow.float64()),
+        ('reviews', pyarrow.int64()),
+        ('description', pyarrow.string()),
+        ('amenities', pyarrow.list_(pyarrow.string())),
+        ('host', pyarrow.string()),
+        ('images', pyarrow.list_(pyarrow.string())),
+        ('property_type', pyarrow.string()),
+        ('capacity', pyarrow.int64()),
+        ('bedrooms', pyarrow.int64()),
+        ('beds', pyarrow.int64()),
+        ('baths', pyarrow.float64()),
+        ('check_in', pyarrow.string()),
+        ('check_out', pyarrow.string()),
+        ('availability', pyarrow.list_(pyarrow.struct([
+            ('start', pyarrow.string()),
+            ('end', pyarrow.string()),
+            ('nightly_price', pyarrow.float64()),
+        ]))),
+    ])
+
+
+class ParquetFilePipeline(FileSinkPipeline):
+    # Columnar output; rows are buffered up to one row group at a time
+    extension = '.parquet'
+
+    def __init__(self, output_dir, max_items=10000, stats=None, row_group_size=1000):
+        if pyarrow is None:
+            raise RuntimeError('Parquet output requires pyarrow (pip install pyarrow)')
+        super().__init__(output_dir, max_items, stats)
+        self.row_group_size = row_group_size
+        self.schema = parquet_schema()
+        self.rows = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = super().from_crawler(crawler)
+        pipeline.row_group_size = crawler.settings.getint('OUTPUT_ROW_GROUP_SIZE', 1000)
+        return pipeline
+
+    def open_file(self, path):
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, item):
+        item['host'] = json.dumps(item.get('host') or {}, ensure_ascii=False)
+        self.rows.append(item)
+        if len(self.rows) >= self.row_group_size:
+            self.write_rows()
+
+    def write_rows(self):
+        if self.rows:
+            self.writer.write_table(pyarrow.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close_file(self):
+        self.write_rows()
+        self.writer.close()
+        self.writer = None
+
+
+def sink_settings(settings, output_dir=None, output_format='ndjson'):
+    # Send items to the API (the default) or to files in output_dir.
+    # Command line priority, so that it wins over the spider's own default.
+    if output_dir:
+        pipeline = 'pipelines.ParquetFilePipeline' if output_format == 'parquet' else 'pipelines.NDJSONFilePipeline'
+        settings.set('OUTPUT_DIR', output_dir, priority='cmdline')
+        settings.set('ITEM_PIPELINES', {pipeline: 300}, priority='cmdline')
+    return settings
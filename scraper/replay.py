@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+
+MANIFEST = 'index.json'
+
+
+def fixture_name(url):
+    return hashlib.sha1(url.encode()).hexdigest() + '.html'
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {'start_urls': [], 'pages': {}}
+    with open(path) as manifest:
+        return json.load(manifest)
+
+
+class RecordMiddleware:
+    # Downloader middleware that saves every successful page to RECORD_DIR,
+    # with a manifest mapping URLs to files, for later offline replay
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = load_manifest(directory)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get('RECORD_DIR')
+        if not directory:
+            raise NotConfigured
+        middleware = cls(directory)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        for url in spider.start_urls:
+            if url not in self.manifest['start_urls']:
+                self.manifest['start_urls'].append(url)
+
+    def process_response(self, request, response, spider):
+        if response.status == 200:
+            name = fixture_name(request.url)
+            with open(os.path.join(self.directory, name), 'wb') as fixture:
+                fixture.write(response.body)
+            self.manifest['pages'][request.url] = name
+        return response
+
+    def spider_closed(self, spider):
+        with open(os.path.join(self.directory, MANIFEST), 'w') as manifest:
+            json.dump(self.manifest, manifest, indent=2)
+
+
+class ReplayMiddleware:
+    # Downloader middleware that answers every request from REPLAY_DIR
+    # instead of the network; pages that were not recorded get a 404
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pages = load_manifest(directory)['pages']
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get('REPLAY_DIR')
+        if not directory:
+            raise NotConfigured
+        return cls(directory)
+
+    def process_request(self, request, spider):
+        name = self.pages.get(request.url) or fixture_name(request.url)
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            spider.crawler.stats.inc_value('replay/missing')
+            return HtmlResponse(url=request.url, status=404, body=b'', request=request)
+
+        with open(path, 'rb') as fixture:
+            body = fixture.read()
+        spider.crawler.stats.inc_value('replay/served')
+        return HtmlResponse(url=request.url, body=body, encoding='utf-8', request=request)
@@ -0,0 +1,245 @@
+import csv
+import os
+import json
+import uuid
+import socket
+import sqlite3
+import time
+import multiprocessing
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.log import configure_logging
+from scrapy.utils.project import get_project_settings
+from twisted.internet import defer, task
+from pipelines import sink_settings
+
+JOB_FIELDS = ('location', 'checkin', 'checkout', 'guests')
+
+# A running job belongs to the worker holding its lease, which the worker
+# renews while it runs; a job whose lease ran out is taken to have lost its
+# worker and is run again
+LEASE_SECONDS = 300
+LEASE_RENEW_INTERVAL = 60
+# Failed jobs go back to the queue, after the jobs not tried yet, until
+# they have been tried this many times
+MAX_ATTEMPTS = 3
+
+
+def read_jobs(path):
+    # Jobs file: CSV with a location,checkin,checkout,guests header, or one
+    # JSON object per line with the same keys. Missing dates are stored as ''
+    # so that the queue's uniqueness check applies to them too
+    with open(path, newline='') as jobs_file:
+        if path.endswith('.csv'):
+            rows = list(csv.DictReader(jobs_file))
+        else:
+            rows = [json.loads(line) for line in jobs_file if line.strip()]
+
+    jobs = []
+    for row in rows:
+        jobs.append({
+            'location': row['location'],
+            'checkin': row.get('checkin') or '',
+            'checkout': row.get('checkout') or '',
+            'guests': int(row.get('guests') or 2),
+        })
+    return jobs
+
+
+class JobQueue:
+    # Crawl jobs persisted in SQLite so that a scheduler run can be stopped
+    # and resumed, and several worker processes can share one queue
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                location TEXT NOT NULL,
+                checkin TEXT,
+                checkout TEXT,
+                guests INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                started_at REAL,
+                finished_at REAL,
+                items INTEGER,
+                requests INTEGER,
+                elapsed REAL,
+                owner TEXT,
+                lease_until REAL,
+                UNIQUE (location, checkin, checkout, guests)
+            )
+        ''')
+        # Queues created before jobs had leases
+        columns = {row['name'] for row in self.connection.execute('PRAGMA table_info(jobs)')}
+        for column, column_type in (('owner', 'TEXT'), ('lease_until', 'REAL')):
+            if column not in columns:
+                self.connection.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+
+    def add_jobs(self, jobs):
+        before = self.connection.total_changes
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO jobs (location, checkin, checkout, guests) VALUES (?, ?, ?, ?)',
+            [tuple(job[field] for field in JOB_FIELDS) for job in jobs]
+        )
+        return self.connection.total_changes - before
+
+    def claim(self, owner):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            # Jobs left running by a worker that died are picked up again;
+            # ones whose worker still renews its lease are left alone
+            self.connection.execute(
+                "UPDATE jobs SET status = 'pending', owner = NULL, lease_until = NULL "
+                "WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)",
+                (now,)
+            )
+            row = self.connection.execute(
+                "SELECT * FROM jobs WHERE status = 'pending' ORDER BY attempts, id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, "
+                    "owner = ?, lease_until = ? WHERE id = ?",
+                    (now, owner, now + LEASE_SECONDS, row['id'])
+                )
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+        return dict(row) if row is not None else None
+
+    def renew(self, owner):
+        self.connection.execute(
+            "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'running'",
+            (time.time() + LEASE_SECONDS, owner)
+        )
+
+    def finish(self, job_id, owner, status, items, requests, elapsed):
+        # A failed job is queued again until it has had max_attempts. Jobs
+        # whose lease another worker took over are left to that worker.
+        if status == 'failed':
+            status = "CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END"
+            params = (self.max_attempts,)
+        else:
+            status, params = '?', (status,)
+        self.connection.execute(
+            f'UPDATE jobs SET status = {status}, owner = NULL, lease_until = NULL, finished_at = ?, '
+            'items = ?, requests = ?, elapsed = ? WHERE id = ? AND owner = ?',
+            params + (time.time(), items, requests, elapsed, job_id, owner)
+        )
+
+    def summary(self):
+        return [dict(row) for row in self.connection.execute('SELECT * FROM jobs ORDER BY id')]
+
+    def close(self):
+        self.connection.close()
+
+
+def scheduler_settings(spiders, domain_concurrency, domain_delay, output_dir=None, output_format='ndjson'):
+    # Every crawler has its own downloader, so the per-domain budget is split
+    # across all spiders that run at the same time
+    settings = get_project_settings()
+    settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', max(1, domain_concurrency // spiders))
+    settings.set('DOWNLOAD_DELAY', domain_delay * spiders)
+    settings.set('AUTOTHROTTLE_ENABLED', True)
+    settings.set('AUTOTHROTTLE_TARGET_CONCURRENCY', max(1.0, domain_concurrency / spiders))
+    return sink_settings(settings, output_dir, output_format)
+
+
+def run_worker(queue_path, concurrency, spiders, domain_concurrency, domain_delay,
+               state_path, max_age_hours, output_dir=None, output_format='ndjson'):
+    # Run up to `concurrency` spiders at once in this process's reactor,
+    # taking jobs from the queue until it is empty
+    from twisted.internet import reactor
+    from airbnb_scraper import AirbnbSpider
+
+    configure_logging()
+    runner = CrawlerRunner(scheduler_settings(spiders, domain_concurrency, domain_delay,
+                                              output_dir, output_format))
+    queue = JobQueue(queue_path)
+    owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    lease_loop = task.LoopingCall(queue.renew, owner)
+
+    def start_next():
+        job = queue.claim(owner)
+        if job is None:
+            return None
+
+        crawler = runner.create_crawler(AirbnbSpider)
+        d = runner.crawl(
+            crawler,
+            location=job['location'],
+            checkin=job['checkin'],
+            checkout=job['checkout'],
+            guests=job['guests'],
+            state_path=state_path,
+            max_age_hours=max_age_hours
+        )
+        d.addCallbacks(
+            lambda _: finished(job, crawler, 'done'),
+            lambda failure: finished(job, crawler, 'failed')
+        )
+        d.addCallback(lambda _: start_next())
+        return d
+
+    def finished(job, crawler, status):
+        stats = crawler.stats.get_stats()
+        queue.finish(
+            job['id'], owner, status,
+            stats.get('item_scraped_count', 0),
+            stats.get('downloader/request_count', 0),
+            stats.get('elapsed_time_seconds', 0),
+        )
+
+    slots = [d for d in (start_next() for _ in range(concurrency)) if d is not None]
+    if slots:
+        lease_loop.start(LEASE_RENEW_INTERVAL, now=False)
+        defer.DeferredList(slots).addBoth(lambda _: reactor.stop())
+        reactor.run()
+    queue.close()
+
+
+def run_scheduler(jobs_path, queue_path, concurrency=4, processes=1,
+                  domain_concurrency=8, domain_delay=0.25, state_path=None, max_age_hours=24,
+                  output_dir=None, output_format='ndjson'):
+    queue = JobQueue(queue_path)
+    if jobs_path:
+        added = queue.add_jobs(read_jobs(jobs_path))
+        print(f"Queued {added} new jobs from {jobs_path}")
+
+    # Each spider gets at least one request slot per domain, so no more
+    # spiders run at once than the per-domain budget allows
+    processes = min(processes, domain_concurrency)
+    concurrency = min(concurrency, max(1, domain_concurrency // processes))
+    spiders = concurrency * processes
+    worker_args = (queue_path, concurrency, spiders, domain_concurrency, domain_delay,
+                   state_path, max_age_hours, output_dir, output_format)
+    if processes > 1:
+        # Each process runs its own reactor; they share the on-disk queue
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=run_worker, args=worker_args) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        run_worker(*worker_args)
+
+    print_summary(queue.summary())
+    queue.close()
+
+
+def print_summary(jobs):
+    print(f"{'location':<24} {'dates':<23} {'guests':>6} {'status':<8} "
+          f"{'items':>6} {'requests':>8} {'seconds':>8} {'items/s':>8}")
+    for job in jobs:
+        elapsed = job['elapsed'] or 0
+        rate = (job['items'] or 0) / elapsed if elapsed else 0
+        dates = f"{job['checkin'] or '-'}..{job['checkout'] or '-'}"
+        print(f"{job['location'][:24]:<24} {dates:<23} {job['guests']:>6} {job['status']:<8} "
+              f"{job['items'] or 0:>6} {job['requests'] or 0:>8} {elapsed:>8.1f} {rate:>8.2f}")